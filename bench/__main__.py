@@ -0,0 +1,82 @@
+"""Benchmarks the site parsers and JSON codecs on generated pages, API responses and gateway events.
+
+Run from the repository root with ``python -m bench``.
+"""
+import argparse
+import json
+import sys
+
+from bot import json_codec
+from bot.sites import parsing
+from .cases import CASES, Case, load_fixture
+from .measure import measure
+
+
+def available_parsers():
+    parsers = ['html.parser']
+    try:
+        import lxml  # noqa: F401
+        parsers.append('lxml')
+    except ImportError:
+        pass
+    return parsers
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench', description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help='number of timed runs per case')
+    parser.add_argument('--parser', action='append', choices=['html.parser', 'lxml'],
+                        help='HTML parser backend to benchmark, may be repeated; defaults to all installed')
+    parser.add_argument('--codec', action='append', choices=sorted(json_codec.CODECS),
+                        help='JSON codec to benchmark, may be repeated; defaults to all installed')
+    parser.add_argument('--case', action='append', help='only run cases with names starting with this prefix')
+    parser.add_argument('--save', metavar='FILE', help='save results as JSON to FILE')
+    parser.add_argument('--compare', metavar='FILE', help='compare median times with results saved in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown against compared results (default: 0.2)')
+    args = parser.parse_args()
+
+    backends = {
+        Case.HTML: args.parser or available_parsers(),
+        Case.JSON: args.codec or list(json_codec.CODECS),
+    }
+    cases = [case for case in CASES if not args.case or any(case.name.startswith(prefix) for prefix in args.case)]
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    results = {}
+    regressions = []
+    print(f'{"case":<32}{"best ms":>10}{"median ms":>11}{"peak KiB":>10}{"blocks":>9}{"vs saved":>10}')
+    for case in cases:
+        text = load_fixture(case.fixture)
+        for backend in backends[case.kind]:
+            key = f'{case.name}[{backend}]'
+            if case.kind == Case.HTML:
+                parsing.PARSER = backend
+            else:
+                json_codec.loads, json_codec.dumps = json_codec.CODECS[backend]
+            result = measure(case.func, text, args.repeat)
+            results[key] = result.to_dict()
+
+            comparison = ''
+            if baseline is not None and key in baseline:
+                ratio = result.median / baseline[key]['median']
+                comparison = f'{ratio:.2f}x'
+                if ratio > 1 + args.tolerance:
+                    regressions.append(key)
+                    comparison += ' !'
+            print(f'{key:<32}{result.best * 1000:>10.2f}{result.median * 1000:>11.2f}'
+                  f'{result.peak / 1024:>10.0f}{result.blocks:>9}{comparison:>10}')
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if regressions:
+        print(f'Slower than saved results by more than {args.tolerance:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+
+from bot import json_codec
+from bot.sites import atcoder, codechef, codeforces
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    """Returns the contents of the fixture file with the given name."""
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as file:
+        return file.read()
+
+
+def parse_cf_contests(text):
+    return codeforces.parse_future_contests(json_codec.loads(text))
+
+
+def parse_cf_users(text):
+    return [codeforces.parse_profile(result) for result in json_codec.loads(text)['result']]
+
+
+def decode(text):
+    return json_codec.loads(text)
+
+
+def roundtrip(text):
+    return json_codec.dumps(json_codec.loads(text))
+
+
+class Case:
+    """A parsing function to benchmark along with the fixture it is run on."""
+
+    HTML = 'html'
+    JSON = 'json'
+
+    def __init__(self, name, fixture, func, kind):
+        """
+        :param name: the name of the case
+        :param fixture: the name of the fixture file
+        :param func: the function that parses the contents of the fixture
+        :param kind: ``Case.HTML`` or ``Case.JSON``, whether the function depends on the HTML parser backend or the
+            JSON codec
+        """
+        self.name = name
+        self.fixture = fixture
+        self.func = func
+        self.kind = kind
+
+
+CASES = [
+    Case('atcoder.contests', 'at_contests.html', atcoder.parse_future_contests, Case.HTML),
+    Case('atcoder.profile', 'at_profile.html', atcoder.parse_profile, Case.HTML),
+    Case('codechef.contests', 'cc_contests.html', codechef.parse_future_contests, Case.HTML),
+    Case('codechef.profile', 'cc_profile.html', codechef.parse_profile, Case.HTML),
+    Case('codeforces.contests', 'cf_contest_list.json', parse_cf_contests, Case.JSON),
+    Case('codeforces.profiles', 'cf_user_info.json', parse_cf_users, Case.JSON),
+    Case('gateway.guild_create', 'gw_guild_create.json', decode, Case.JSON),
+    Case('gateway.roundtrip', 'gw_guild_create.json', roundtrip, Case.JSON),
+]
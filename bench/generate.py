@@ -0,0 +1,424 @@
+"""Generates the fixtures in ``bench/fixtures`` as synthetic pages, API responses and gateway events.
+
+The fixtures follow the structure of the real ones at the size of a typical response, and only contain placeholder
+names and handles. Output is deterministic for a given seed.
+
+Run from the repository root with ``python -m bench.generate``.
+"""
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from .cases import FIXTURES_DIR
+
+# The handles and ratings in the profile pages, which the replay server substitutes for the requested ones.
+AT_HANDLE = 'at_user_0001'
+AT_RATING = 2871
+CC_HANDLE = 'cc_user_0001'
+CC_RATING = 2563
+
+# The time the fixtures are generated as of.
+NOW = datetime(2018, 9, 1, 12, 0, tzinfo=timezone.utc)
+
+JST = timezone(timedelta(hours=9))
+IST = timezone(timedelta(hours=5, minutes=30))
+
+COUNTRIES = ['Argentina', 'Bangladesh', 'Brazil', 'Canada', 'China', 'Egypt', 'France', 'Germany', 'India',
+             'Indonesia', 'Iran', 'Italy', 'Japan', 'Kazakhstan', 'Korea, Republic of', 'Poland', 'Romania', 'Russia',
+             'Taiwan', 'Ukraine', 'United States', 'Vietnam']
+CF_RANKS = [(1200, 'newbie'), (1400, 'pupil'), (1600, 'specialist'), (1900, 'expert'), (2100, 'candidate master'),
+            (2300, 'master'), (2400, 'international master'), (2600, 'grandmaster'),
+            (3000, 'international grandmaster'), (10 ** 9, 'legendary grandmaster')]
+AT_COLORS = [(400, 'gray'), (800, 'brown'), (1200, 'green'), (1600, 'cyan'), (2000, 'blue'), (2400, 'yellow'),
+             (2800, 'orange'), (10 ** 9, 'red')]
+
+
+def placeholder_name(index):
+    return f'First{index:04}', f'Last{index:04}'
+
+
+def hex_id(rng, length=32):
+    return ''.join(rng.choice('0123456789abcdef') for _ in range(length))
+
+
+def snowflake(rng):
+    return str(rng.randrange(10 ** 17, 10 ** 18))
+
+
+def cf_rank(rating):
+    return next(rank for limit, rank in CF_RANKS if rating < limit)
+
+
+def at_color(rating):
+    return next(color for limit, color in AT_COLORS if rating < limit)
+
+
+def page_head(rng, title, scripts):
+    """Returns the head of a page with stylesheets, scripts and an inline script of the given number of statements,
+    which make up most of a real page."""
+    lines = [f'<head><title>{title}</title>', '<meta charset="utf-8">',
+             '<meta name="viewport" content="width=device-width, initial-scale=1.0">']
+    for index in range(12):
+        lines.append(f'<link href="/public/css/{hex_id(rng, 8)}.css?v={index}" rel="stylesheet" type="text/css">')
+    for index in range(16):
+        lines.append(f'<script src="/public/js/{hex_id(rng, 8)}.js?v={index}"></script>')
+    lines.append('<script>')
+    for index in range(scripts):
+        lines.append(f'var v{index} = {{"key": "{hex_id(rng, 16)}", "value": {rng.randrange(10 ** 6)}}};')
+    lines.append('</script>')
+    lines.append('</head>')
+    return '\n'.join(lines)
+
+
+def page_footer(links):
+    items = ''.join(f'<li><a href="/page/{index}">Link {index}</a></li>' for index in range(links))
+    return f'<footer class="footer"><ul class="footer-links">{items}</ul><p>Copyright</p></footer>'
+
+
+def at_contest_row(rng, start, name, path):
+    hours, mins = rng.choice([(1, 40), (1, 40), (2, 0), (2, 30), (5, 0)])
+    rated = rng.choice([' ~ 1199', ' ~ 1999', ' ~ 2799', 'All', '-'])
+    start = start.astimezone(JST)
+    iso = start.strftime('%Y%m%dT%H%M')
+    return f'''<tr>
+<td class="text-center"><a href="http://www.timeanddate.com/worldclock/fixedtime.html?iso={iso}&p1=248" \
+target="blank"><time class="fixtime fixtime-full">{start.strftime('%Y-%m-%d %H:%M:%S%z')}</time></a></td>
+<td><span aria-hidden="true" data-toggle="tooltip" title="Algorithm">&#9398;</span> \
+<a href="{path}">{name}</a></td>
+<td class="text-center">{hours:02}:{mins:02}</td>
+<td class="text-center">{rated}</td>
+</tr>'''
+
+
+def at_contest_table(table_id, title, rows):
+    return f'''<div id="contest-table-{table_id}">
+<h4>{title}</h4>
+<div class="table-responsive">
+<table class="table table-default table-striped table-hover table-condensed table-bordered small">
+<thead><tr><th>Start Time</th><th>Contest Name</th><th>Duration</th><th>Rated Range</th></tr></thead>
+<tbody>
+{chr(10).join(rows)}
+</tbody>
+</table>
+</div>
+</div>'''
+
+
+def at_contests(rng):
+    def rows(count, first_start, step):
+        result = []
+        for index in range(count):
+            number = rng.randrange(1, 200)
+            kind = rng.choice(['abc', 'arc', 'agc', 'other'])
+            if kind == 'other':
+                path, name = f'/contests/contest{number:03}', f'Sponsored Contest {number:03}'
+            else:
+                path, name = f'/contests/{kind}{number:03}', f'AtCoder {kind.upper()} {number:03}'
+            result.append(at_contest_row(rng, first_start + step * index, name, path))
+        return result
+
+    tables = [
+        at_contest_table('permanent', 'Permanent Contests', rows(4, NOW - timedelta(days=2000), timedelta(days=100))),
+        at_contest_table('action', 'Active Contests', rows(2, NOW - timedelta(hours=1), timedelta(minutes=30))),
+        at_contest_table('upcoming', 'Upcoming Contests', rows(12, NOW + timedelta(days=1), timedelta(days=3))),
+        at_contest_table('recent', 'Recent Contests', rows(10, NOW - timedelta(days=30), timedelta(days=3))),
+    ]
+    return f'''<!DOCTYPE html>
+<html>
+{page_head(rng, 'Contest - AtCoder', 1000)}
+<body>
+<nav class="navbar"><ul><li><a href="/contests">Contests</a></li><li><a href="/ranking">Ranking</a></li></ul></nav>
+<div id="main-container" class="container">
+<div class="row">
+<div class="col-lg-9 col-md-8">
+{chr(10).join(tables)}
+</div>
+</div>
+</div>
+{page_footer(40)}
+</body>
+</html>
+'''
+
+
+def at_profile(rng):
+    history = []
+    rating = 0
+    for index in range(120):
+        rating = max(0, rating + rng.randrange(-80, 200))
+        color = at_color(rating)
+        history.append(f'<tr><td class="text-right">{(NOW - timedelta(days=7 * (120 - index))).date()}</td>'
+                       f'<td><a href="/contests/abc{index:03}">AtCoder ABC {index:03}</a></td>'
+                       f'<td class="text-right"><a href="/contests/abc{index:03}/standings?watching={AT_HANDLE}">'
+                       f'{rng.randrange(1, 3000)}</a></td><td class="text-right"><span class="user-{color}">'
+                       f'{rating}</span></td><td class="text-right">{rng.randrange(-80, 200)}</td></tr>')
+    color = at_color(AT_RATING)
+    return f'''<!DOCTYPE html>
+<html>
+{page_head(rng, f'{AT_HANDLE} - AtCoder', 150)}
+<body>
+<div id="main-container" class="container">
+<div class="row">
+<div class="col-sm-3">
+<img class="avatar" src="https://img.atcoder.jp/icons/{hex_id(rng)}.png" width="128" height="128">
+<h3><a class="username" href="/users/{AT_HANDLE}"><span class="user-{color}">{AT_HANDLE}</span></a></h3>
+<table class="dl-table">
+<tr><th class="no-break">Country/Region</th><td>{rng.choice(COUNTRIES)}</td></tr>
+<tr><th class="no-break">Affiliation</th><td>Example University</td></tr>
+</table>
+</div>
+<div class="col-sm-9">
+<table class="dl-table mt-2">
+<tr><th class="no-break">Rank</th><td>{rng.randrange(1, 100)}th</td></tr>
+<tr><th class="no-break">Rating</th><td><span class="user-{color}">{AT_RATING}</span></td></tr>
+<tr><th class="no-break">Highest Rating</th><td><span class="user-{color}">{AT_RATING + 40}</span></td></tr>
+<tr><th class="no-break">Rated Matches</th><td>120</td></tr>
+</table>
+<table id="history" class="table table-bordered table-striped th-center">
+<thead><tr><th>Date</th><th>Contest</th><th>Rank</th><th>Performance</th><th>Diff</th></tr></thead>
+<tbody>
+{chr(10).join(history)}
+</tbody>
+</table>
+</div>
+</div>
+</div>
+{page_footer(40)}
+</body>
+</html>
+'''
+
+
+def cc_contest_table(title, contests):
+    rows = []
+    for code, name, start, end in contests:
+        rows.append(f'''<tr>
+<td>{code}</td>
+<td><a href="/{code}">{name}</a></td>
+<td class="start_date" data-starttime="{start.astimezone(IST).isoformat()}">{start.astimezone(IST):%d %b %Y %H:%M}</td>
+<td class="end_date" data-endtime="{end.astimezone(IST).isoformat()}">{end.astimezone(IST):%d %b %Y %H:%M}</td>
+</tr>''')
+    return f'''<h3>{title}</h3>
+<div class="table-questions">
+<table class="dataTable">
+<thead><tr><th>Code</th><th>Name</th><th>Start</th><th>End</th></tr></thead>
+<tbody>
+{chr(10).join(rows)}
+</tbody>
+</table>
+</div>'''
+
+
+def cc_contests(rng):
+    def contests(count, first_start, step, prefix):
+        result = []
+        for index in range(count):
+            start = first_start + step * index
+            length = rng.choice([timedelta(hours=2, minutes=30), timedelta(hours=3), timedelta(days=10)])
+            result.append((f'{prefix}{index:04}', f'Contest {prefix}{index:04}', start, start + length))
+        return result
+
+    tables = [
+        cc_contest_table('Present Contests', contests(8, NOW - timedelta(days=5), timedelta(days=1), 'PRES')),
+        cc_contest_table('Future Contests', contests(10, NOW + timedelta(days=1), timedelta(days=2), 'FUT')),
+        cc_contest_table('Past Contests', contests(2500, NOW - timedelta(days=4000), timedelta(days=1.5), 'PAST')),
+    ]
+    return f'''<!DOCTYPE html>
+<html lang="en">
+{page_head(rng, 'Programming Contests | CodeChef', 400)}
+<body>
+<header id="header"><div class="header-menu"><ul><li><a href="/practice">Practice</a></li>\
+<li><a href="/contests">Compete</a></li></ul></div></header>
+<div class="content-wrapper">
+{chr(10).join(tables)}
+</div>
+{page_footer(60)}
+</body>
+</html>
+'''
+
+
+def cc_profile(rng):
+    ratings = ''.join(f'<tr><td>CONTEST{index:03}</td><td>{1500 + rng.randrange(-300, 1200)}</td></tr>'
+                      for index in range(150))
+    solved = ', '.join(f'<a href="/status/PROB{index:04},{CC_HANDLE}">PROB{index:04}</a>' for index in range(1200))
+    return f'''<!DOCTYPE html>
+<html lang="en">
+{page_head(rng, f'{CC_HANDLE} | CodeChef User Profile', 300)}
+<body>
+<header id="header"><div class="header-menu"><ul><li><a href="/practice">Practice</a></li>\
+<li><a href="/contests">Compete</a></li></ul></div></header>
+<div class="content-wrapper">
+<aside class="sidebar">
+<div class="rating-header text-center">
+<div class="rating-number">{CC_RATING}</div>
+<div class="rating-star">{'<span>&#9733;</span>' * 6}</div>
+</div>
+<div class="rating-ranks"><ul class="inline-list"><li><a href="/ratings/all"><strong>{rng.randrange(1, 100)}</strong>\
+</a> Global Rank</li></ul></div>
+</aside>
+<section class="user-details">
+<div class="user-details-container plr10">
+<header>
+<img src="/sites/default/files/uploads/pictures/{hex_id(rng)}.png" width="70px" height="70px" class="profileImage">
+<h2>{' '.join(placeholder_name(1))}</h2>
+</header>
+<section class="user-details">
+<ul>
+<li><label>Username:</label><span><span class="m-username--link">{CC_HANDLE}</span></span></li>
+<li><label>Country:</label><span><span class="user-country-name">{rng.choice(COUNTRIES)}</span></span></li>
+<li><label>Institution:</label><span>Example University</span></li>
+</ul>
+</section>
+</div>
+</section>
+<section class="rating-data-section">
+<table class="rating-table">
+<thead><tr><th>Contest</th><th>Rating</th></tr></thead>
+<tbody>{ratings}</tbody>
+</table>
+</section>
+<section class="rating-data-section problems-solved">
+<h5>Problems Solved</h5>
+<article><p>{solved}</p></article>
+</section>
+</div>
+{page_footer(60)}
+</body>
+</html>
+'''
+
+
+def cf_contest_list(rng, count):
+    now = int(NOW.timestamp())
+    contests = []
+    for index in range(count):
+        contest_id = count - index
+        duration = rng.choice([7200, 7200, 8100, 9000, 10800])
+        if index < 8:
+            start = now + (8 - index) * 3 * 86400
+            phase = 'BEFORE'
+        else:
+            start = now - index * 2 * 86400
+            phase = 'FINISHED'
+        contests.append({
+            'id': contest_id,
+            'name': f'Codeforces Round {contest_id} (Div. {rng.choice([1, 2, 3])})',
+            'type': rng.choice(['CF', 'CF', 'ICPC']),
+            'phase': phase,
+            'frozen': False,
+            'durationSeconds': duration,
+            'startTimeSeconds': start,
+            'relativeTimeSeconds': now - start,
+        })
+    return {'status': 'OK', 'result': contests}
+
+
+def cf_user(rng, index):
+    rating = rng.randrange(1200, 3600)
+    max_rating = rating + rng.randrange(0, 200)
+    first_name, last_name = placeholder_name(index)
+    user_id = 100000 + index
+    return {
+        'handle': f'user_{index:03}',
+        'avatar': f'//userpic.codeforces.com/{user_id}/avatar/{hex_id(rng, 16)}.jpg',
+        'titlePhoto': f'//userpic.codeforces.com/{user_id}/title/{hex_id(rng, 16)}.jpg',
+        'contribution': rng.randrange(-50, 200),
+        'lastOnlineTimeSeconds': int(NOW.timestamp()) - rng.randrange(10 ** 6),
+        'friendOfCount': rng.randrange(5000),
+        'registrationTimeSeconds': int(NOW.timestamp()) - rng.randrange(10 ** 7, 3 * 10 ** 8),
+        'rating': rating,
+        'maxRating': max_rating,
+        'rank': cf_rank(rating),
+        'maxRank': cf_rank(max_rating),
+        'firstName': first_name,
+        'lastName': last_name,
+        'country': rng.choice(COUNTRIES),
+        'city': f'City{rng.randrange(100):02}',
+        'organization': f'Example University {rng.randrange(50):02}',
+    }
+
+
+def cf_user_info(rng, count):
+    return {'status': 'OK', 'result': [cf_user(rng, index) for index in range(count)]}
+
+
+def gw_guild_create(rng, members):
+    roles = [{'id': snowflake(rng), 'name': f'role{index}', 'color': rng.randrange(1 << 24), 'hoist': index < 5,
+              'position': index, 'permissions': rng.randrange(1 << 30), 'managed': False, 'mentionable': False}
+             for index in range(60)]
+    channels = [{'id': snowflake(rng), 'type': 0 if index % 5 else 4, 'name': f'channel-{index}', 'position': index,
+                 'topic': f'Topic of channel {index}' if index % 3 else None, 'nsfw': False,
+                 'last_message_id': snowflake(rng), 'rate_limit_per_user': 0, 'parent_id': None,
+                 'permission_overwrites': [{'id': rng.choice(roles)['id'], 'type': 'role',
+                                            'allow': rng.randrange(1 << 20), 'deny': rng.randrange(1 << 20)}
+                                           for _ in range(rng.randrange(4))]}
+                for index in range(120)]
+    emojis = [{'id': snowflake(rng), 'name': f'emoji{index}', 'roles': [], 'require_colons': True, 'managed': False,
+               'animated': index % 4 == 0} for index in range(80)]
+    users = [{'id': snowflake(rng), 'username': f'member{index:05}', 'discriminator': f'{rng.randrange(10000):04}',
+              'avatar': hex_id(rng) if rng.random() < 0.8 else None} for index in range(members)]
+    member_list = [{'user': user, 'nick': f'nick{index:05}' if rng.random() < 0.2 else None,
+                    'roles': [role['id'] for role in rng.sample(roles, rng.randrange(4))],
+                    'joined_at': (NOW - timedelta(seconds=rng.randrange(10 ** 8))).isoformat(), 'premium_since': None,
+                    'deaf': False, 'mute': False}
+                   for index, user in enumerate(users)]
+    presences = []
+    for user in users:
+        status = rng.choice(['online', 'online', 'idle', 'dnd'])
+        game = {'name': f'Game {rng.randrange(100)}', 'type': 0} if rng.random() < 0.3 else None
+        presences.append({'user': {'id': user['id']}, 'status': status, 'game': game,
+                          'client_status': {rng.choice(['desktop', 'mobile', 'web']): status},
+                          'activities': [game] if game else []})
+    guild = {
+        'id': snowflake(rng),
+        'name': 'Competitive Programming',
+        'icon': hex_id(rng),
+        'owner_id': users[0]['id'],
+        'region': 'us-east',
+        'member_count': members,
+        'large': members > 250,
+        'unavailable': False,
+        'joined_at': NOW.isoformat(),
+        'roles': roles,
+        'emojis': emojis,
+        'features': [],
+        'voice_states': [],
+        'channels': channels,
+        'members': member_list,
+        'presences': presences,
+    }
+    return {'t': 'GUILD_CREATE', 's': 2, 'op': 0, 'd': guild}
+
+
+def write(name, text):
+    with open(os.path.join(FIXTURES_DIR, name), 'w', encoding='utf-8') as file:
+        file.write(text)
+    print(f'{name}: {len(text.encode()) / 1024:.0f} KiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench.generate', description=__doc__.splitlines()[0])
+    parser.add_argument('--seed', type=int, default=0, help='seed for the random data (default: 0)')
+    parser.add_argument('--cf-contests', type=int, default=2000,
+                        help='number of contests in the Codeforces contest list (default: 2000)')
+    parser.add_argument('--cf-users', type=int, default=200,
+                        help='number of users in the Codeforces user info response (default: 200, the batch size)')
+    parser.add_argument('--guild-members', type=int, default=5000,
+                        help='number of members in the guild create event (default: 5000)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    write('at_contests.html', at_contests(rng))
+    write('at_profile.html', at_profile(rng))
+    write('cc_contests.html', cc_contests(rng))
+    write('cc_profile.html', cc_profile(rng))
+    write('cf_contest_list.json', json.dumps(cf_contest_list(rng, args.cf_contests)))
+    write('cf_user_info.json', json.dumps(cf_user_info(rng, args.cf_users)))
+    write('gw_guild_create.json', json.dumps(gw_guild_create(rng, args.guild_members)))
+
+
+if __name__ == '__main__':
+    main()
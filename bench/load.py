@@ -0,0 +1,143 @@
+"""Runs one profile refresh cycle of every site against a replay server with synthetic users.
+
+Start the replay server first with ``python -m bench.replay``, then run ``python -m bench.load`` from the repository
+root.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+from bot.bot import Bot
+from bot.discord import Client
+from bot.entity_manager import EntityManager
+from bot.sites import AtCoder, CodeChef, Codeforces, SiteContainer
+
+
+class MemoryConnector:
+    """Keeps the bot's documents in memory in place of ``MongoDBConnector``."""
+
+    def __init__(self, users):
+        self.users = {user['discord_id']: user for user in users}
+        self.channels = {}
+
+    def connect(self):
+        pass
+
+    async def put_user(self, user):
+        self.users[user['discord_id']] = user
+
+    async def update_user_site_profiles(self, updates):
+        for discord_id, dm_channel_id, site_tag, profile in updates:
+            user = self.users.get(discord_id)
+            if user is None:
+                if profile is None:
+                    continue
+                user = self.users[discord_id] = {'discord_id': discord_id, 'dm_channel_id': dm_channel_id,
+                                                 'site_profiles': {}}
+            if profile is None:
+                user['site_profiles'].pop(site_tag, None)
+            else:
+                user['site_profiles'][site_tag] = profile
+
+    async def migrate_site_profiles(self):
+        migrated = 0
+        for user in self.users.values():
+            if isinstance(user['site_profiles'], list):
+                user['site_profiles'] = {profile['site_tag']: profile for profile in user['site_profiles']}
+                migrated += 1
+        return migrated
+
+    async def put_channel(self, channel):
+        self.channels[channel['id']] = channel
+
+    async def get_all_users(self):
+        return list(self.users.values())
+
+    async def get_all_channels(self):
+        return list(self.channels.values())
+
+
+def make_users(num_users, num_handles, site_tags):
+    """Returns user documents subscribed to handles drawn from a pool, a fifth of them from its 100 most popular
+    handles so that those are shared by many users.
+    """
+    users = []
+    for i in range(num_users):
+        profiles = []
+        for site_tag in random.sample(site_tags, random.randint(1, len(site_tags))):
+            popular = random.random() < 0.2
+            handle = f'user{random.randrange(min(100, num_handles) if popular else num_handles)}'
+            profiles.append({'handle': handle, 'site_tag': site_tag, 'rating': None})
+        users.append({'discord_id': str(10 ** 17 + i), 'dm_channel_id': str(2 * 10 ** 17 + i),
+                      'site_profiles': profiles})
+    return users
+
+
+async def run(args):
+    site_kwargs = {
+        'contest_refresh_interval': 3600,
+        'user_refresh_interval': 3600,
+        'user_delay_interval': 1 / args.rate if args.rate > 0 else 0,
+        'max_connections': args.concurrency,
+        'fetch_concurrency': args.concurrency,
+        'handler_concurrency': args.concurrency,
+    }
+    sites = [
+        AtCoder(base_url=f'{args.url}/at', **site_kwargs),
+        CodeChef(base_url=f'{args.url}/cc', **site_kwargs),
+        Codeforces(base_url=f'{args.url}/cf', api_url=f'{args.url}/cf/api', **site_kwargs),
+    ]
+    site_container = SiteContainer(sites)
+    client = Client('token', api_url=f'{args.url}/discord')
+    users = make_users(args.users, args.handles, [site.TAG for site in sites])
+    entity_manager = EntityManager(MemoryConnector(users))
+    bot = Bot('Bot', client, site_container, entity_manager)
+
+    notified = 0
+
+    async def on_profile_fetch(user, old_profile, new_profile):
+        nonlocal notified
+        await bot.on_profile_fetch(user, old_profile, new_profile)
+        notified += 1
+
+    try:
+        begin = time.perf_counter()
+        await entity_manager.run()
+        await entity_manager.wait_until_loaded()
+        await site_container.run(get_handles=bot.get_site_handles, get_subscribers=bot.get_site_subscribers,
+                                 on_profile_fetch=on_profile_fetch)
+        while site_container.get_loading_site_names():
+            await asyncio.sleep(0.01)
+        print(f'Loaded {args.users} users and contests in {time.perf_counter() - begin:.2f}s')
+
+        for site in sites:
+            handles = len(bot.get_site_handles(site.TAG))
+            notified = 0
+            begin = time.perf_counter()
+            await site.update_users()
+            elapsed = time.perf_counter() - begin
+            print(f'{site.NAME}: {handles} handles, {notified} subscribers updated in {elapsed:.2f}s '
+                  f'({handles / elapsed:.0f} handles/s, {notified / elapsed:.0f} subscribers/s)')
+    finally:
+        await bot.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench.load', description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help='URL of the replay server')
+    parser.add_argument('--users', type=int, default=100000, help='number of synthetic users')
+    parser.add_argument('--handles', type=int, default=50000, help='size of the pool handles are drawn from')
+    parser.add_argument('--rate', type=float, default=1000, help='profile requests per second per site, 0 for no limit')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent fetches and handlers per site')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log', default='WARNING')
+    args = parser.parse_args()
+    logging.basicConfig(format='{levelname}:{name}:{message}', style='{', level=args.log.upper())
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
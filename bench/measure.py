@@ -0,0 +1,46 @@
+import gc
+import statistics
+import time
+import tracemalloc
+
+
+class Result:
+    """Measurements of a benchmarked function."""
+
+    __slots__ = ('best', 'median', 'peak', 'blocks')
+
+    def __init__(self, best, median, peak, blocks):
+        """
+        :param best: the shortest run time in seconds
+        :param median: the median run time in seconds
+        :param peak: the peak memory traced during a run in bytes
+        :param blocks: the number of memory blocks left allocated by a run, including its result and any garbage
+                       awaiting collection
+        """
+        self.best = best
+        self.median = median
+        self.peak = peak
+        self.blocks = blocks
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+def measure(func, arg, repeat):
+    """Run ``func(arg)`` ``repeat`` times for timing, and once more under tracemalloc for memory."""
+    times = []
+    gc.collect()
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - begin)
+
+    gc.collect()
+    tracemalloc.start()
+    result = func(arg)
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    del result
+    return Result(min(times), statistics.median(times), peak, blocks)
@@ -0,0 +1,304 @@
+"""Serves generated site pages and fake Discord REST and gateway endpoints for offline load testing.
+
+Run from the repository root with ``python -m bench.replay``, and point the bot at it with the ``base_url`` and
+``api_url`` site options and the ``discord_api_url`` option, for example ``http://127.0.0.1:8080/at`` for AtCoder.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+import zlib
+
+from aiohttp import web
+
+from bot.discord.ratelimit import get_route_key
+from .cases import load_fixture
+from .generate import AT_HANDLE, AT_RATING, CC_HANDLE, CC_RATING
+
+BOT_USER = {'id': '1', 'username': 'Bot', 'discriminator': '0000', 'bot': True}
+
+
+class ReplayServer:
+    """A local stand-in for the supported sites and Discord.
+
+    Profiles exist for every handle except those starting with ``missing``. Ratings are derived from the handle, and
+    change with a configurable probability on every request.
+    """
+
+    def __init__(self, latency=0, rate_limit_prob=0, route_limit=5, route_window=5, heartbeat_interval=41250,
+                 event_rate=0, rating_change_prob=0, reconnect_interval=0, shards=1,
+                 drop_ack_prob=0):
+        """
+        :param latency: the delay in seconds before every response
+        :param rate_limit_prob: the probability of a Discord REST request being rate limited regardless of its bucket
+        :param route_limit: the number of requests allowed per Discord route per window
+        :param route_window: the length of a Discord rate limit window in seconds
+        :param heartbeat_interval: the gateway heartbeat interval in milliseconds
+        :param event_rate: the number of unsolicited gateway events, like presence updates, sent per second
+        :param rating_change_prob: the probability of a profile having a changed rating on a request
+        :param reconnect_interval: the interval in seconds after which the gateway asks clients to reconnect
+        :param shards: the shard count recommended to clients
+        :param drop_ack_prob: the probability of a heartbeat not being acknowledged, as on a dead connection
+        """
+        self.latency = latency
+        self.rate_limit_prob = rate_limit_prob
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.heartbeat_interval = heartbeat_interval
+        self.event_rate = event_rate
+        self.rating_change_prob = rating_change_prob
+        self.reconnect_interval = reconnect_interval
+        self.shards = shards
+        self.drop_ack_prob = drop_ack_prob
+        self.stats = {'site_requests': 0, 'discord_requests': 0, 'rate_limited': 0, 'messages': 0}
+        self._windows = {}
+        self._sessions = {}
+        self._next_id = int(time.time() * 1000)
+        self._templates = {
+            'at_contests': load_fixture('at_contests.html'),
+            'at_profile': load_fixture('at_profile.html'),
+            'cc_contests': load_fixture('cc_contests.html'),
+            'cc_profile': load_fixture('cc_profile.html'),
+            'cf_contests': load_fixture('cf_contest_list.json'),
+            'cf_user': json.loads(load_fixture('cf_user_info.json'))['result'][1],
+        }
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    def make_app(self):
+        """Returns the aiohttp application serving all endpoints."""
+        app = web.Application(middlewares=[self._latency_middleware])
+        app.router.add_get('/at/contests', self._at_contests)
+        app.router.add_get('/at/users/{handle}', self._at_profile)
+        app.router.add_get('/cc/contests', self._cc_contests)
+        app.router.add_get('/cc/users/{handle}', self._cc_profile)
+        app.router.add_get('/cf/api/contest.list', self._cf_contests)
+        app.router.add_get('/cf/api/user.info', self._cf_users)
+        app.router.add_get('/discord/ws', self._gateway)
+        app.router.add_route('*', '/discord/{path:.*}', self._discord)
+        return app
+
+    @web.middleware
+    async def _latency_middleware(self, request, handler):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    def _new_id(self):
+        self._next_id += 1
+        return str(self._next_id)
+
+    def _rating(self, handle):
+        rating = zlib.crc32(handle.encode()) % 3000 + 500
+        if random.random() < self.rating_change_prob:
+            rating += random.randint(-100, 100)
+        return rating
+
+    # Sites begin.
+
+    async def _at_contests(self, request):
+        self.stats['site_requests'] += 1
+        return web.Response(text=self._templates['at_contests'], content_type='text/html')
+
+    async def _at_profile(self, request):
+        self.stats['site_requests'] += 1
+        handle = request.match_info['handle']
+        if handle.startswith('missing'):
+            raise web.HTTPNotFound()
+        page = self._templates['at_profile'].replace(AT_HANDLE, handle)
+        page = page.replace(f'>{AT_RATING}<', f'>{self._rating(handle)}<', 1)
+        return web.Response(text=page, content_type='text/html')
+
+    async def _cc_contests(self, request):
+        self.stats['site_requests'] += 1
+        return web.Response(text=self._templates['cc_contests'], content_type='text/html')
+
+    async def _cc_profile(self, request):
+        self.stats['site_requests'] += 1
+        handle = request.match_info['handle']
+        if handle.startswith('missing'):
+            raise web.HTTPNotFound()
+        page = self._templates['cc_profile'].replace(CC_HANDLE, handle)
+        page = page.replace(f'>{CC_RATING}<', f'>{self._rating(handle)}<', 1)
+        return web.Response(text=page, content_type='text/html')
+
+    async def _cf_contests(self, request):
+        self.stats['site_requests'] += 1
+        return web.Response(text=self._templates['cf_contests'], content_type='application/json')
+
+    async def _cf_users(self, request):
+        self.stats['site_requests'] += 1
+        handles = request.query.get('handles', '').split(';')
+        for handle in handles:
+            if handle.startswith('missing'):
+                data = {'status': 'FAILED', 'comment': f'handles: User with handle {handle} not found'}
+                return web.json_response(data, status=400)
+        results = []
+        for handle in handles:
+            result = dict(self._templates['cf_user'], handle=handle, rating=self._rating(handle))
+            results.append(result)
+        return web.json_response({'status': 'OK', 'result': results})
+
+    # Discord begin.
+
+    def _rate_limit(self, method, path):
+        """Returns the rate limit headers for a request, and whether the request is rate limited."""
+        key = get_route_key(method, path)
+        now = time.time()
+        window = self._windows.get(key)
+        if window is None or now >= window[0]:
+            window = self._windows[key] = [now + self.route_window, self.route_limit]
+        limited = window[1] == 0 or random.random() < self.rate_limit_prob
+        if not limited:
+            window[1] -= 1
+        headers = {
+            'X-RateLimit-Limit': str(self.route_limit),
+            'X-RateLimit-Remaining': str(window[1]),
+            'X-RateLimit-Reset': str(window[0]),
+            'X-RateLimit-Reset-After': f'{window[0] - now:.3f}',
+        }
+        return headers, limited, window[0] - now
+
+    async def _discord(self, request):
+        self.stats['discord_requests'] += 1
+        path = '/' + request.match_info['path']
+        if path == '/gateway' or path == '/gateway/bot':
+            url = f'ws://{request.host}/discord/ws'
+            return web.json_response({'url': url, 'shards': self.shards,
+                                      'session_start_limit': {'total': 1000, 'remaining': 1000,
+                                                              'reset_after': 0, 'max_concurrency': 1}})
+
+        headers, limited, reset_after = self._rate_limit(request.method, path)
+        if limited:
+            self.stats['rate_limited'] += 1
+            data = {'message': 'You are being rate limited.', 'retry_after': int(reset_after * 1000) + 1,
+                    'global': False}
+            return web.json_response(data, status=429, headers=headers)
+
+        parts = path.strip('/').split('/')
+        if parts[0] == 'channels' and len(parts) == 3 and parts[2] == 'messages' and request.method == 'POST':
+            self.stats['messages'] += 1
+            message = await request.json()
+            return web.json_response(self._make_message(parts[1], message), headers=headers)
+        if parts[0] == 'channels' and len(parts) == 4 and request.method == 'PATCH':
+            message = await request.json()
+            return web.json_response(self._make_message(parts[1], message, parts[3]), headers=headers)
+        if parts[0] == 'channels' and len(parts) == 2 and request.method == 'GET':
+            return web.json_response({'id': parts[1], 'type': 0, 'name': 'general', 'guild_id': '2'}, headers=headers)
+        if parts[:3] == ['users', '@me', 'channels'] and request.method == 'POST':
+            data = await request.json()
+            channel = {'id': self._new_id(), 'type': 1,
+                       'recipients': [{'id': data['recipient_id'], 'username': 'user', 'discriminator': '0001'}]}
+            return web.json_response(channel, headers=headers)
+        if parts[0] == 'channels' and (parts[-1] == 'typing' or 'reactions' in parts):
+            return web.Response(status=204, headers=headers)
+        raise web.HTTPNotFound()
+
+    def _make_message(self, channel_id, message, message_id=None):
+        return {
+            'id': message_id or self._new_id(),
+            'type': 0,
+            'channel_id': channel_id,
+            'author': BOT_USER,
+            'content': message.get('content', ''),
+            'embeds': [message['embed']] if message.get('embed') else [],
+        }
+
+    async def _gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        state = {'seq': 0}
+        deflator = zlib.compressobj() if request.query.get('compress') == 'zlib-stream' else None
+
+        async def send(payload):
+            data = json.dumps(payload)
+            if deflator is None:
+                await ws.send_str(data)
+                return
+            data = deflator.compress(data.encode()) + deflator.flush(zlib.Z_SYNC_FLUSH)
+            # Split messages across frames like Discord may, so that clients must buffer them.
+            middle = len(data) // 2
+            await ws.send_bytes(data[:middle])
+            await ws.send_bytes(data[middle:])
+
+        async def dispatch(typ, data):
+            state['seq'] += 1
+            await send({'t': typ, 's': state['seq'], 'op': 0, 'd': data})
+
+        async def noise():
+            while True:
+                await asyncio.sleep(1 / self.event_rate)
+                await dispatch('PRESENCE_UPDATE', {'user': {'id': self._new_id()}, 'status': 'online',
+                                                   'game': None, 'guild_id': '2', 'roles': []})
+
+        async def request_reconnect():
+            await asyncio.sleep(self.reconnect_interval)
+            await send({'t': None, 's': None, 'op': 7, 'd': None})
+
+        await send({'t': None, 's': None, 'op': 10, 'd': {'heartbeat_interval': self.heartbeat_interval}})
+        tasks = []
+        if self.event_rate:
+            tasks.append(asyncio.ensure_future(noise()))
+        if self.reconnect_interval:
+            tasks.append(asyncio.ensure_future(request_reconnect()))
+        session_id = None
+        try:
+            async for msg in ws:
+                payload = json.loads(msg.data)
+                op = payload['op']
+                if op == 1:
+                    if random.random() < self.drop_ack_prob:
+                        continue
+                    await send({'t': None, 's': None, 'op': 11, 'd': None})
+                elif op == 2:
+                    session_id = uuid.uuid4().hex
+                    await dispatch('READY', {'v': 6, 'user': BOT_USER, 'session_id': session_id,
+                                             'shard': payload['d'].get('shard'), 'guilds': [],
+                                             'private_channels': []})
+                elif op == 6:
+                    session_id = payload['d']['session_id']
+                    if session_id not in self._sessions:
+                        await send({'t': None, 's': None, 'op': 9, 'd': False})
+                        continue
+                    state['seq'] = self._sessions[session_id]
+                    await dispatch('RESUMED', {})
+        finally:
+            for task in tasks:
+                task.cancel()
+            if session_id is not None:
+                self._sessions[session_id] = state['seq']
+        return ws
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench.replay', description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='delay in seconds before every response')
+    parser.add_argument('--rate-limit-prob', type=float, default=0,
+                        help='probability of a Discord request being rate limited at random')
+    parser.add_argument('--route-limit', type=int, default=5, help='Discord requests allowed per route per window')
+    parser.add_argument('--route-window', type=float, default=5, help='Discord rate limit window in seconds')
+    parser.add_argument('--event-rate', type=float, default=0, help='unsolicited gateway events per second')
+    parser.add_argument('--rating-change-prob', type=float, default=0.1,
+                        help='probability of a changed rating on each profile request')
+    parser.add_argument('--reconnect-interval', type=float, default=0,
+                        help='seconds after which the gateway asks clients to reconnect')
+    parser.add_argument('--shards', type=int, default=1, help='shard count recommended to clients')
+    parser.add_argument('--drop-ack-prob', type=float, default=0,
+                        help='probability of a heartbeat not being acknowledged')
+    parser.add_argument('--log', default='WARNING')
+    args = parser.parse_args()
+    logging.basicConfig(format='{levelname}:{name}:{message}', style='{', level=args.log.upper())
+
+    server = ReplayServer(latency=args.latency, rate_limit_prob=args.rate_limit_prob, route_limit=args.route_limit,
+                          route_window=args.route_window, event_rate=args.event_rate,
+                          rating_change_prob=args.rating_change_prob, reconnect_interval=args.reconnect_interval,
+                          shards=args.shards, drop_ack_prob=args.drop_ack_prob)
+    web.run_app(server.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
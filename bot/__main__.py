@@ -3,11 +3,13 @@ import asyncio
 import json
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from .bot import Bot
 from .entity_manager import EntityManager
+from .snapshot import Snapshot
 from .db import MongoDBConnector
-from .discord import Client
+from .discord import Client, Intent
 from .sites import AtCoder, CodeChef, Codeforces, SiteContainer
 
 logger = logging.getLogger(__name__)
@@ -22,13 +24,25 @@ with open('./bot/config.json') as file:
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--log', default='WARNING')
+    parser.add_argument('--shard-count', type=int, help='total number of shards; defaults to that recommended')
     args = parser.parse_args()
     numeric_level = getattr(logging, args.log.upper(), None)
     if not isinstance(numeric_level, int):
         raise ValueError(f'Invalid log level: {args.log}')
     logging.basicConfig(format='{levelname}:{name}:{message}', style='{', level=numeric_level)
+    if CONFIG.get('shard_ids') is not None:
+        # All shards must run in one process, see ShardManager.
+        raise ValueError('shard_ids is not supported, all shards run in one process')
 
-    discord_client = Client(DISCORD_TOKEN, name=CONFIG['name'], activity_name=CONFIG['activity'])
+    intents = None
+    if CONFIG.get('gateway_intents') is not None:
+        intents = Intent(0)
+        for name in CONFIG['gateway_intents']:
+            intents |= Intent[name]
+    discord_client = Client(DISCORD_TOKEN, name=CONFIG['name'], activity_name=CONFIG['activity'],
+                            api_url=CONFIG.get('discord_api_url'), compress=CONFIG.get('gateway_compress', False),
+                            guild_subscriptions=CONFIG.get('gateway_guild_subscriptions', True), intents=intents,
+                            shard_count=args.shard_count or CONFIG.get('shard_count'))
     mongodb_connector = MongoDBConnector(MONGODB_SRV, CONFIG['db_name'])
     entity_manager = EntityManager(mongodb_connector)
     sites = [
@@ -36,15 +50,26 @@ def main():
         CodeChef(**CONFIG['cc_config']),
         Codeforces(**CONFIG['cf_config']),
     ]
-    site_container = SiteContainer(sites=sites)
+    # Parse pages in worker processes if configured, threads of the event loop's default executor otherwise.
+    parse_processes = CONFIG.get('parse_processes')
+    parse_executor = ProcessPoolExecutor(parse_processes) if parse_processes else None
+    site_container = SiteContainer(sites=sites, parse_executor=parse_executor)
+
+    # Start from a local snapshot if configured, before the database is loaded and the sites fetched.
+    snapshot_path = CONFIG.get('snapshot_path')
+    snapshot = Snapshot(snapshot_path) if snapshot_path else None
 
     bot = Bot(CONFIG['name'], discord_client, site_container, entity_manager,
-              triggers=CONFIG['triggers'], allowed_channels=CONFIG['channels'])
+              triggers=CONFIG['triggers'], allowed_channels=CONFIG['channels'], metrics_port=CONFIG.get('metrics_port'),
+              snapshot=snapshot, snapshot_interval=CONFIG.get('snapshot_interval', 600))
 
     try:
         asyncio.run(bot.run())
     except Exception:
         logger.exception('Grinding halt')
+    finally:
+        if parse_executor is not None:
+            parse_executor.shutdown()
 
 
 if __name__ == '__main__':
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import platform
 from datetime import timedelta, timezone
@@ -5,23 +6,37 @@ from operator import itemgetter
 
 from . import command, commands
 from .discord import Channel
+from .metrics import LoopLagMonitor, MetricsServer
 from .models import User
+from .paginator import PaginationManager, Pages
 
 
 class Bot:
     PYTHON_URL = 'https://www.python.org'
     GITHUB_URL = 'https://github.com/meooow25/cp-discord-bot'
     CONTESTS_PER_PAGE = 5
+    COMMANDS_PER_PAGE = 4
     # TODO: Support separate time zones per channel or server
     TIMEZONE = timezone(timedelta(hours=5, minutes=30))
 
-    def __init__(self, name, client, site_container, entity_manager, triggers=None, allowed_channels=None):
+    def __init__(self, name, client, site_container, entity_manager, triggers=None, allowed_channels=None,
+                 metrics_port=None, snapshot=None, snapshot_interval=600):
+        """
+        :param snapshot: the ``Snapshot`` to start from and save the state of users, channels and contests to, if any
+        :param snapshot_interval: the interval in seconds between saves of the snapshot
+        """
         self.name = name
         self.client = client
         self.site_container = site_container
         self.entity_manager = entity_manager
         self.triggers = triggers
         self.allowed_channels = allowed_channels
+        self.loop_lag = LoopLagMonitor()
+        self.paginators = PaginationManager(client)
+        # Metrics are served for Prometheus only if a port is given.
+        self.metrics_server = None if metrics_port is None else MetricsServer(port=metrics_port)
+        self.snapshot = snapshot
+        self.snapshot_interval = snapshot_interval
         self.logger = logging.getLogger(self.__class__.__qualname__)
 
         self.command_map = {}
@@ -45,6 +60,8 @@ class Bot:
             'title': 'Supported commands:',
             'fields': fields,
         }
+        # The help message does not change, so its pages are rendered once and shared by all help messages.
+        self.help_pages = Pages(self.help_message, per_page=self.COMMANDS_PER_PAGE)
 
         # Info message begin.
         self.info_message = {
@@ -71,11 +88,79 @@ class Bot:
         }
 
     async def run(self):
-        """Runs the entity manager, site container, and Discord client."""
-        await self.entity_manager.run()
-        await self.site_container.run(get_all_users=self.get_all_users,
-                                      on_profile_fetch=self.on_profile_fetch)
-        await self.client.run(on_message=self.on_message)
+        """Runs the entity manager, site container, and Discord client.
+
+        The client connects right away, while users and channels are loaded from the database in the background.
+        Messages are handled once they are loaded, or right away if they are restored from a snapshot. Sites are run
+        from then on, and fetch contests in the background.
+        """
+        asyncio.create_task(self.loop_lag.run())
+        asyncio.create_task(self.paginators.run())
+        client_task = None
+        try:
+            if self.metrics_server is not None:
+                await self.metrics_server.start()
+            if self.snapshot is not None:
+                self.restore_snapshot()
+            await self.entity_manager.run()
+            client_task = asyncio.create_task(self.client.run(on_message=self.on_message))
+            await self.entity_manager.wait_until_loaded()
+            await self.site_container.run(get_handles=self.get_site_handles,
+                                          get_subscribers=self.get_site_subscribers,
+                                          on_profile_fetch=self.on_profile_fetch)
+            if self.snapshot is not None:
+                asyncio.create_task(self._snapshot_task())
+            await client_task
+        finally:
+            if client_task is not None:
+                client_task.cancel()
+            await self.close()
+
+    def restore_snapshot(self):
+        """Restores users, channels and contests from the snapshot, if there is a usable one."""
+        state = self.snapshot.load()
+        if state is not None:
+            self.entity_manager.restore(state)
+            self.site_container.restore(state)
+
+    async def save_snapshot(self):
+        """Saves users, channels and contests to the snapshot.
+
+        The state is collected on the event loop, and encoded and written in the default executor.
+        """
+        if self.entity_manager.users is None:
+            # Nothing was loaded, keep the previous snapshot.
+            return
+        state = self.entity_manager.get_state()
+        state.update(self.site_container.get_state())
+        await asyncio.get_running_loop().run_in_executor(None, self.snapshot.save, state)
+
+    async def _snapshot_task(self):
+        """Run forever and save the snapshot at regular intervals."""
+        while True:
+            try:
+                await asyncio.sleep(self.snapshot_interval)
+                await self.save_snapshot()
+            except asyncio.CancelledError:
+                self.logger.info('Received CancelledError, stopping task')
+                break
+            except Exception as ex:
+                self.logger.exception(f'Exception in saving snapshot: {ex}, continuing regardless')
+
+    async def close(self):
+        """Saves pending changes to users and the snapshot, closes the HTTP sessions of the site container and Discord
+        client, and stops serving metrics.
+        """
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        await self.entity_manager.close()
+        if self.snapshot is not None:
+            try:
+                await self.save_snapshot()
+            except Exception:
+                self.logger.exception('Failed to save snapshot')
+        await self.site_container.close()
+        await self.client.close()
 
     async def on_message(self, message):
         """Callback intended to be executed when the Discord client receives a message."""
@@ -95,6 +180,8 @@ class Bot:
                 return
         on_allowed_channel = self.allowed_channels is None or message.channel_id in self.allowed_channels
 
+        # Commands and channel lookups need users and channels, which may still be loading on a cold start.
+        await self.entity_manager.wait_until_loaded()
         channel = await self.get_channel(message.channel_id)
         if channel.type == Channel.Type.DM:
             await self.run_command_from_map(args, message, is_dm=True)
@@ -130,9 +217,13 @@ class Bot:
             await self.entity_manager.save_channel(channel)
         return channel
 
-    def get_all_users(self):
-        """Returns a shallow copy of the list of all users."""
-        return self.entity_manager.users[:]
+    def get_site_handles(self, site_tag):
+        """Returns a list of the distinct handles subscribed to on the site with the given tag."""
+        return self.entity_manager.get_site_handles(site_tag)
+
+    def get_site_subscribers(self, site_tag, handle):
+        """Returns a list of the users subscribed to the given handle on the site with the given tag."""
+        return self.entity_manager.get_site_subscribers(site_tag, handle)
 
     async def on_profile_fetch(self, user, old_profile, new_profile):
         """Callback intended to be executed when the site container updates a user site profile."""
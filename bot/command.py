@@ -1,3 +1,9 @@
+from .metrics import REGISTRY, Timer
+
+COMMAND_SECONDS = REGISTRY.histogram('bot_command_duration_seconds', 'Duration of command executions',
+                                     ['command', 'outcome'])
+
+
 class Command:
     """An executable bot command."""
 
@@ -22,7 +28,12 @@ class Command:
 
     async def execute(self, *args, **kwargs):
         """Execute the command."""
-        await self.func(*args, **kwargs)
+        with Timer(COMMAND_SECONDS, self.name) as timer:
+            try:
+                await self.func(*args, **kwargs)
+            except IncorrectUsageException:
+                timer.outcome = 'incorrect_usage'
+                raise
 
     def embed_field_rep(self):
         """Returns a Discord embed field representing this command."""
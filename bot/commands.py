@@ -4,6 +4,7 @@ import time
 from datetime import datetime, timedelta
 
 from .discord import Channel
+from .metrics import format_seconds
 from . import command, paginator
 
 logger = logging.getLogger(__name__)
@@ -21,9 +22,7 @@ async def beep(bot, args, message):
                       'information about that command')
 async def help(bot, args, message):
     if not args:
-        reply = bot.help_message
-        await paginator.paginate_and_send(reply, bot, message.channel_id, per_page=4,
-                                          time_active=15 * 60, time_delay=2 * 60)
+        await paginator.send_pages(bot.help_pages, bot, message.channel_id, time_active=15 * 60, time_delay=2 * 60)
     else:
         command.assert_arglen(args, 1, cmd=message.content)
         cmd_name = args.pop()
@@ -75,12 +74,16 @@ async def next(bot, args, message):
         contests = bot.site_container.get_future_contests_cnt(cnt, site_tag_to_name.keys())
         logger.info(f'{len(contests)} contests fetched out of {cnt}')
 
+    # Contests of sites that are still loading are missing, say so rather than wait for them.
+    loading = bot.site_container.get_loading_site_names(site_tag_to_name.keys())
+    loading_note = f'\n*Still loading contests of {", ".join(loading)}*' if loading else ''
     if contests:
         reply = create_message_from_contests(contests, cnt, site_tag_to_name.values(), bot.TIMEZONE)
+        reply['content'] += loading_note
         await paginator.paginate_and_send(reply, bot, message.channel_id, per_page=bot.CONTESTS_PER_PAGE,
                                           time_active=15 * 60, time_delay=2 * 60)
     else:
-        reply = {'content': '*No contest found*'}
+        reply = {'content': '*No contest found*' + loading_note}
         await bot.client.send_message(reply, message.channel_id)
 
 
@@ -137,7 +140,8 @@ async def status(bot, args, message):
     uptime = (now - bot.client.start_time) / 3600
     field1 = {
         'name': 'Bot Uptime',
-        'value': f'Online since {uptime:.1f} hrs ago'
+        'value': f'Online since {uptime:.1f} hrs ago\n'
+                 f'Active paginated messages: {len(bot.paginators)}'
     }
     field2 = {
         'name': 'Last Updated',
@@ -145,9 +149,26 @@ async def status(bot, args, message):
     }
     # TODO: Shift the code below to a member function of Site.
     for site in bot.site_container.sites:
+        if site.contests_last_fetched is None:
+            field2['value'] += f'{site.NAME}: loading\n'
+            continue
         last = (now - site.contests_last_fetched) / 60
         field2['value'] += f'{site.NAME}: {last:.0f} mins ago\n'
-    reply['embed']['fields'] += [field1, field2]
+    field3 = {
+        'name': 'Latency',
+        'value': '',
+    }
+    for shard in bot.client.shard_manager.shards:
+        field3['value'] += (f'Shard {shard.shard_id} heartbeat: {format_seconds(shard.latency)}, '
+                            f'p90 {format_seconds(shard.heartbeat_rtt.quantile(0.9))}, '
+                            f'{shard.missed_acks.value} missed\n')
+    dispatch_latency = bot.client.dispatch_latency
+    field3['value'] += (f'Dispatch: p50 {format_seconds(dispatch_latency.quantile(0.5))}, '
+                        f'p99 {format_seconds(dispatch_latency.quantile(0.99))}\n')
+    loop_lag = bot.loop_lag.histogram
+    field3['value'] += (f'Event loop lag: {format_seconds(bot.loop_lag.last)}, '
+                        f'p99 {format_seconds(loop_lag.quantile(0.99))}, max {format_seconds(loop_lag.max)}')
+    reply['embed']['fields'] += [field1, field2, field3]
     await bot.client.send_message(reply, message.channel_id)
 
 
@@ -1,11 +1,19 @@
 import asyncio
 import logging
 import motor.motor_asyncio
+from pymongo import UpdateOne
+
+from ..metrics import REGISTRY, timed
+
+DB_SECONDS = REGISTRY.histogram('bot_db_call_duration_seconds', 'Duration of database calls', ['call', 'outcome'])
 
 
 class MongoDBConnector:
     """Handles connection with a MongoDB database."""
 
+    # The ID of the document in the migrations collection recording that site profiles were converted to maps.
+    SITE_PROFILES_MIGRATION = 'site_profiles_by_tag'
+
     def __init__(self, srv_url, db_name):
         self.srv_url = srv_url
         self.db_name = db_name
@@ -20,19 +28,82 @@ class MongoDBConnector:
         self.client = motor.motor_asyncio.AsyncIOMotorClient(self.srv_url, io_loop=loop)
         self.db = self.client[self.db_name]
 
+    @timed(DB_SECONDS, 'put_user')
     async def put_user(self, user):
         """Store a user to the database."""
         await self.db.users.replace_one({'discord_id': user['discord_id']}, user, upsert=True)
 
+    @staticmethod
+    def _site_profile_update(dm_channel_id, site_tag, profile):
+        """Returns the update document that stores a site profile of a user, or removes it if ``profile`` is
+        ``None``.
+        """
+        if profile is None:
+            return {'$unset': {f'site_profiles.{site_tag}': ''}}
+        return {
+            '$set': {f'site_profiles.{site_tag}': profile},
+            '$setOnInsert': {'dm_channel_id': dm_channel_id},
+        }
+
+    @timed(DB_SECONDS, 'set_user_site_profile')
+    async def set_user_site_profile(self, discord_id, dm_channel_id, site_tag, profile):
+        """Store a site profile of a user, keyed by site tag. The user is created with the given DM channel ID if it
+        does not exist.
+        """
+        await self.db.users.update_one({'discord_id': discord_id},
+                                       self._site_profile_update(dm_channel_id, site_tag, profile), upsert=True)
+
+    @timed(DB_SECONDS, 'unset_user_site_profile')
+    async def unset_user_site_profile(self, discord_id, site_tag):
+        """Remove the site profile of a user with the given site tag."""
+        await self.db.users.update_one({'discord_id': discord_id}, self._site_profile_update(None, site_tag, None))
+
+    @timed(DB_SECONDS, 'update_user_site_profiles')
+    async def update_user_site_profiles(self, updates):
+        """Store or remove site profiles of users in one batch.
+
+        :param updates: a list of tuples of the Discord ID, the DM channel ID, the site tag and the profile of a user,
+                        where the profile is ``None`` if it should be removed
+        """
+        requests = [UpdateOne({'discord_id': discord_id}, self._site_profile_update(dm_channel_id, site_tag, profile),
+                              upsert=profile is not None)
+                    for discord_id, dm_channel_id, site_tag, profile in updates]
+        await self.db.users.bulk_write(requests, ordered=False)
+
+    @timed(DB_SECONDS, 'migrate_site_profiles')
+    async def migrate_site_profiles(self):
+        """Convert the site profiles of users stored as a list to a map keyed by site tag. Returns the number of users
+        converted.
+
+        Finding such users scans the whole collection, so this is done only once, and recorded in the ``migrations``
+        collection.
+        """
+        if await self.db.migrations.find_one({'_id': self.SITE_PROFILES_MIGRATION}) is not None:
+            return 0
+        cursor = self.db.users.find({'site_profiles': {'$type': 'array'}}, {'discord_id': True, 'site_profiles': True})
+        requests = []
+        async for user in cursor:
+            profiles = {profile['site_tag']: profile for profile in user['site_profiles']}
+            requests.append(UpdateOne({'_id': user['_id']}, {'$set': {'site_profiles': profiles}}))
+        if requests:
+            await self.db.users.bulk_write(requests, ordered=False)
+            self.logger.info(f'Migrated site profiles of {len(requests)} users')
+        await self.db.migrations.replace_one({'_id': self.SITE_PROFILES_MIGRATION},
+                                             {'_id': self.SITE_PROFILES_MIGRATION, 'users': len(requests)}, upsert=True)
+        return len(requests)
+
+    @timed(DB_SECONDS, 'put_channel')
     async def put_channel(self, channel):
         """Store a channel to the database."""
         await self.db.channels.replace_one({'id': channel['id']}, channel, upsert=True)
 
+    @timed(DB_SECONDS, 'get_all_users')
     async def get_all_users(self):
         """Retrieve a list of all users from the database."""
         cursor = self.db.users.find()
         return await cursor.to_list(length=None)
 
+    @timed(DB_SECONDS, 'get_all_channels')
     async def get_all_channels(self):
         """Retrieve a list of all channels from the database."""
         cursor = self.db.channels.find()
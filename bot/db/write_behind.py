@@ -0,0 +1,95 @@
+import asyncio
+import itertools
+import logging
+
+
+class WriteBehindQueue:
+    """Coalesces writes by key and flushes them in batches in the background.
+
+    Only the latest item put for a key is written. Pending items are flushed every ``flush_interval`` seconds, or
+    sooner once ``batch_size`` of them are pending. Items of a failed flush are kept for the next one, unless they have
+    been superseded meanwhile.
+    """
+
+    def __init__(self, write_batch, flush_interval=1, batch_size=500):
+        """
+        :param write_batch: the coroutine function that writes a list of items
+        :param flush_interval: the maximum time in seconds an item stays pending while flushes succeed
+        :param batch_size: the maximum number of items written together
+        """
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._full = None
+        self._lock = None
+        self._task = None
+        self._closing = False
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        """Start flushing in the background."""
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_task())
+
+    def put(self, key, item):
+        """Queue an item to be written, replacing any pending item with the same key."""
+        # Move the key to the end so that items are written in the order of their last update.
+        self._pending.pop(key, None)
+        self._pending[key] = item
+        if self._full is not None and len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def flush(self):
+        """Write all pending items. Returns whether all writes succeeded."""
+        if self._lock is None:
+            # Created lazily so that it is bound to the running event loop.
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._pending:
+                keys = list(itertools.islice(self._pending, self.batch_size))
+                batch = {key: self._pending.pop(key) for key in keys}
+                try:
+                    await self.write_batch(list(batch.values()))
+                except asyncio.CancelledError:
+                    for key, item in batch.items():
+                        self._pending.setdefault(key, item)
+                    raise
+                except Exception:
+                    self.logger.exception(f'Failed to write {len(batch)} items, retrying later')
+                    for key, item in batch.items():
+                        self._pending.setdefault(key, item)
+                    return False
+                self.logger.info(f'Wrote {len(batch)} items')
+        return True
+
+    async def _flush_task(self):
+        """Run until closed, flush whenever the interval passes or a batch fills up."""
+        # The flag is checked as well as cancellation, since wait_for can swallow a cancellation that arrives as the
+        # wait completes.
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def close(self):
+        """Stop flushing in the background and write all pending items, including those put before flushing was
+        started.
+        """
+        self._closing = True
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                # Wait for a flush in progress to put back its batch, so that the flush below writes it.
+                await task
+            except asyncio.CancelledError:
+                pass
+        if not await self.flush():
+            self.logger.error(f'{len(self._pending)} items could not be written')
@@ -1,4 +1,5 @@
-from .client import Client, EventType
+from .client import Client
+from .gateway import EventType, GatewayError, Intent, Shard, ShardManager
 from .models import Channel, Message, User
 
-__all__ = ['Channel', 'Client', 'EventType', 'Message', 'User']
+__all__ = ['Channel', 'Client', 'EventType', 'GatewayError', 'Intent', 'Message', 'Shard', 'ShardManager', 'User']
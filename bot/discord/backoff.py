@@ -0,0 +1,28 @@
+import random
+
+
+class ExponentialBackoff:
+    """Computes delays for retrying an operation, doubling the upper bound of the delay on every attempt.
+
+    Delays are jittered between half the bound and the bound, so that many clients disconnected together do not
+    retry in lockstep.
+    """
+
+    def __init__(self, base=1, cap=120):
+        """
+        :param base: the bound of the first delay in seconds
+        :param cap: the maximum bound of a delay in seconds
+        """
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next_delay(self):
+        """Returns the delay before the next attempt."""
+        bound = min(self.cap, self.base * 2 ** self.attempt)
+        self.attempt += 1
+        return random.uniform(bound / 2, bound)
+
+    def reset(self):
+        """Start over from the first delay, intended to be called after a success."""
+        self.attempt = 0
@@ -1,165 +1,216 @@
 import asyncio
-import json
 import logging
-import platform
-import time
-from enum import IntEnum
 
 import aiohttp
 
+from .. import json_codec
+from ..metrics import REGISTRY, Timer
+from .gateway import EventType, ShardManager
 from .models import Channel, Message
+from .ratelimit import RateLimiter, get_route_template
 
-
-class Opcode(IntEnum):
-    DISPATCH = 0
-    HEARTBEAT = 1
-    IDENTIFY = 2
-    STATUS_UPDATE = 3
-    VOICE_STATE_UPDATE = 4
-    RESUME = 6
-    RECONNECT = 7
-    REQUEST_GUILD_MEMBERS = 8
-    INVALID_SESSION = 9
-    HELLO = 10
-    HEARTBEAT_ACK = 11
-
-
-class EventType:
-    # This list is not exhaustive.
-    READY = 'READY'
-    CHANNEL_CREATE = 'CHANNEL_CREATE'
-    CHANNEL_UPDATE = 'CHANNEL_UPDATE'
-    CHANNEL_DELETE = 'CHANNEL_DELETE'
-    GUILD_CREATE = 'GUILD_CREATE'
-    GUILD_UPDATE = 'GUILD_UPDATE'
-    GUILD_DELETE = 'GUILD_DELETE'
-    MESSAGE_CREATE = 'MESSAGE_CREATE'
-    MESSAGE_UPDATE = 'MESSAGE_UPDATE'
-    MESSAGE_DELETE = 'MESSAGE_DELETE'
-    PRESENCE_UPDATE = 'PRESENCE_UPDATE'
-    TYPING_START = 'TYPING_START'
-    MESSAGE_REACTION_ADD = 'MESSAGE_REACTION_ADD'
-    MESSAGE_REACTION_REMOVE = 'MESSAGE_REACTION_REMOVE'
+DISPATCH_LATENCY = REGISTRY.histogram('discord_dispatch_latency_seconds',
+                                      'Delay between receiving a gateway event and starting its handler')
+REQUEST_SECONDS = REGISTRY.histogram('discord_request_duration_seconds',
+                                     'Duration of Discord API requests by route and response status',
+                                     ['route', 'outcome'])
+RATE_LIMITED = REGISTRY.counter('discord_rate_limited_total', 'Discord API responses with status 429',
+                                ['route', 'scope'])
 
 
 class Client:
     API_URL = 'https://discordapp.com/api'
-
-    def __init__(self, token, name='Bot', activity_name=None):
+    MAX_RATE_LIMIT_RETRIES = 5
+    # The delay in seconds before retrying a rate limited request if the response does not say.
+    DEFAULT_RETRY_AFTER = 5
+    DNS_CACHE_TTL = 300
+    KEEPALIVE_TIMEOUT = 60
+    REACTION_EVENTS = (EventType.MESSAGE_REACTION_ADD, EventType.MESSAGE_REACTION_REMOVE)
+
+    def __init__(self, token, name='Bot', activity_name=None, max_connections=10, api_url=None, compress=False,
+                 guild_subscriptions=True, intents=None, shard_count=None):
+        """
+        :param compress: whether the gateway should compress all messages with zlib-stream transport compression
+        :param guild_subscriptions: whether to receive presence and typing events of guilds
+        :param intents: the ``Intent`` flags of the events to receive, or None to receive all events
+        :param shard_count: the total number of shards, the count recommended by Discord if ``None``
+        """
         self.token = token
+        if api_url is not None:
+            # Such as that of a local replay server.
+            self.API_URL = api_url
         self.name = name
+        self.max_connections = max_connections
         self.headers = {
             'Authorization': f'Bot {self.token}',
             'User-Agent': self.name,
         }
         self.activity_name = activity_name
+        self.compress = compress
+        self.guild_subscriptions = guild_subscriptions
+        self.intents = intents
+        self.shard_count = shard_count
 
         self.on_message = None
         self.listeners = {}
+        # Listeners to reactions on particular messages, keyed by message ID.
+        self.reaction_listeners = {}
         self.user = None
         self.start_time = None
-        self.last_seq = None
+        self.shard_manager = ShardManager(self, shard_count=shard_count)
+        self.rate_limiter = RateLimiter()
+        # The delay between receiving an event and starting its handler.
+        self.dispatch_latency = DISPATCH_LATENCY.labels()
+        self._session = None
+        self._gateway_session = None
         self.logger = logging.getLogger(self.__class__.__qualname__)
 
     async def run(self, *, on_message):
-        """Connect to Discord and run forever."""
+        """Connect the shards to Discord and run forever.
+
+        Shards reconnect and resume their sessions when their connections drop. Only raises ``GatewayError`` if a
+        connection cannot be re-established.
+        """
         self.on_message = on_message
-        resp = await self._request('GET', '/gateway')
-        socket_url = resp['url']
-        async with aiohttp.ClientSession() as session:
-            async with session.ws_connect(f'{socket_url}?v=6&encoding=json') as ws:
-                self.start_time = time.time()
-                self.logger.info('Websocket connected')
-                async for msg in ws:
-                    if msg.type == aiohttp.WSMsgType.CLOSE:
-                        self.logger.error(f'Discord closed the connection: {msg.data}, {msg.extra}')
-                        raise Exception(f'Websocket closed')
-                    if msg.type == aiohttp.WSMsgType.ERROR:
-                        self.logger.error(f'Websocket error response: {msg.data}')
-                        raise Exception(f'Websocket error')
-                    elif msg.type == aiohttp.WSMsgType.TEXT:
-                        await self._handle_message(ws, msg.data)
-                    else:
-                        self.logger.warning(f'Unhandled type: {msg.type}, {msg.data}')
-        raise Exception('Discord websocket disconnected')
+        await self.shard_manager.run()
+
+    async def get_gateway(self):
+        """Get the gateway URL along with the recommended shard count and session start limits."""
+        return await self._request('GET', '/gateway/bot')
+
+    def get_session(self):
+        """Returns the HTTP session used for the Discord API, creating it if necessary.
+
+        Connections are kept alive and DNS lookups are cached across requests.
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             ttl_dns_cache=self.DNS_CACHE_TTL,
+                                             keepalive_timeout=self.KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, json_serialize=json_codec.dumps)
+        return self._session
+
+    def get_gateway_session(self):
+        """Returns the HTTP session used for gateway websockets, creating it if necessary.
+
+        The websocket of every shard holds a connection for as long as it is open, so they are kept apart from the
+        limited pool of API connections, without a limit of their own.
+        """
+        if self._gateway_session is None:
+            connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=self.DNS_CACHE_TTL)
+            self._gateway_session = aiohttp.ClientSession(connector=connector)
+        return self._gateway_session
+
+    async def close(self):
+        """Close the HTTP sessions."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._gateway_session is not None:
+            await self._gateway_session.close()
+            self._gateway_session = None
 
     async def _request(self, method, path, headers=None, json_data=None, expect_json=True):
-        """Send a HTTP request to the Discord API."""
+        """Send a HTTP request to the Discord API.
+
+        Requests are queued according to the rate limits of their route and the global rate limit. Requests that are
+        rate limited anyway are retried after the time indicated by Discord.
+
+        :param json_data: the body, serialized to JSON if not already serialized as ``bytes``
+        """
         headers = headers or self.headers
+        body = {'json': json_data}
+        if isinstance(json_data, bytes):
+            headers = {**headers, 'Content-Type': 'application/json'}
+            body = {'data': json_data}
         self.logger.debug(f'Request: {method} {path} {headers} {json_data}')
-        async with aiohttp.request(method, f'{self.API_URL}{path}', headers=headers, json=json_data) as response:
-            # TODO: Implement a way of ensuring rate limits
-            response.raise_for_status()
-            if expect_json:
-                return await response.json()
-
-    async def _handle_message(self, ws, msg):
-        """Handle a websocket message."""
-        msg = json.loads(msg)
-        op = msg['op']
-        if msg.get('s'):
-            self.last_seq = msg['s']
-        typ = msg.get('t')
-        data = msg.get('d')
-        self.logger.info(f'Received: {op} {typ}')
-        if op == Opcode.HELLO:
-            self.logger.info(data)
-            reply = {
-                'op': Opcode.IDENTIFY,
-                'd': {
-                    'token': self.token,
-                    'properties': {
-                        '$os': platform.platform(terse=1),
-                    },
-                    'compress': False,
-                },
-            }
-            if self.activity_name:
-                reply['d']['presence'] = {
-                    'game': {
-                        'name': self.activity_name,
-                        'type': 0,
-                    },
-                    'status': 'online',
-                    'since': None,
-                    'afk': False,
-                }
-            await ws.send_json(reply)
-            asyncio.create_task(self._heartbeat_task(ws, data['heartbeat_interval']))
-        elif op == Opcode.HEARTBEAT_ACK:
-            self.logger.info('Heartbeat-ack received')
-        elif op == Opcode.DISPATCH:
-            self.logger.debug('Handling dispatch')
-            await self._handle_dispatch(typ, data)
-        else:
-            self.logger.info(f'Did not handle opcode with data: {data}')
-
-    async def _heartbeat_task(self, ws, interval_ms):
-        """Run forever, send a heartbeat through the websocket ``ws`` every ``interval_ms`` milliseconds."""
-        interval_sec = interval_ms / 1000
-        data = {'op': Opcode.HEARTBEAT}
-        while True:
-            await asyncio.sleep(interval_sec)
-            data['d'] = self.last_seq
-            self.logger.info(f'Sending heartbeat {self.last_seq}')
-            await ws.send_json(data)
-
-    async def _handle_dispatch(self, typ, data):
-        """Handle a websocket dispatch event."""
+        bucket = self.rate_limiter.get_bucket(method, path)
+        route = get_route_template(method, path)
+        for attempt in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            await self.rate_limiter.wait_global()
+            locked = await bucket.acquire()
+            try:
+                with Timer(REQUEST_SECONDS, route) as timer:
+                    async with self.get_session().request(method, f'{self.API_URL}{path}', headers=headers,
+                                                           **body) as response:
+                        timer.outcome = str(response.status)
+                        bucket.update(response.headers)
+                        if response.status == 429:
+                            scope = 'global' if response.headers.get('X-RateLimit-Global') else 'route'
+                            RATE_LIMITED.labels(route, scope).inc()
+                        if response.status == 429 and attempt < self.MAX_RATE_LIMIT_RETRIES:
+                            retry_after, is_global = await self._get_retry_after(response)
+                            self.logger.warning(f'Rate limited on {bucket.key}, retrying in {retry_after:.2f}s')
+                            if is_global:
+                                self.rate_limiter.block_global(retry_after)
+                            else:
+                                bucket.block(retry_after)
+                            continue
+                        response.raise_for_status()
+                        if expect_json:
+                            return await response.json(loads=json_codec.loads)
+                        return
+            finally:
+                bucket.release(locked)
+
+    async def _get_retry_after(self, response):
+        """Returns the delay in seconds after which a rate limited request may be retried, and whether the limit is
+        global.
+
+        The delay is read from the body, or from the headers if the body is not the expected JSON, such as an HTML
+        error page served by Cloudflare.
+        """
+        try:
+            data = await response.json(loads=json_codec.loads)
+            # API v6 gives retry_after in milliseconds.
+            return data['retry_after'] / 1000, bool(data.get('global'))
+        except (aiohttp.ContentTypeError, ValueError, KeyError, TypeError):
+            self.logger.warning(f'Unexpected rate limit response of type {response.content_type}, using headers')
+        retry_after = response.headers.get('Retry-After') or response.headers.get('X-RateLimit-Reset-After')
+        try:
+            retry_after = float(retry_after)
+        except (TypeError, ValueError):
+            retry_after = self.DEFAULT_RETRY_AFTER
+        return retry_after, bool(response.headers.get('X-RateLimit-Global'))
+
+    def is_handled(self, typ):
+        """Whether a dispatch event of type ``typ`` is handled by the client or a listener."""
+        if typ == EventType.READY:
+            return True
+        if typ == EventType.MESSAGE_CREATE:
+            return self.on_message is not None
+        if typ in self.REACTION_EVENTS and self.reaction_listeners:
+            return True
+        return bool(self.listeners.get(typ))
+
+    async def handle_dispatch(self, shard, typ, data, received):
+        """Handle a dispatch event received by a shard.
+
+        :param received: the event loop time at which the event was received
+        """
         if typ == EventType.READY:
             self.user = data['user']
-            self.logger.info(f'Self data: {self.user}')
+            self.logger.info(f'Shard {shard.shard_id} ready, self data: {self.user}')
         elif typ == EventType.MESSAGE_CREATE:
             if self.on_message:
                 message = Message(**data)
                 self.logger.debug('Calling on_message handler')
                 # Run on_message as a separate coroutine.
-                asyncio.create_task(self.on_message(message))
+                asyncio.create_task(self._run_handler(self.on_message, received, message))
         else:
+            if typ in self.REACTION_EVENTS:
+                # Reactions on messages without a listener, the vast majority, are dropped without spawning a task.
+                listener = self.reaction_listeners.get(data['message_id'])
+                if listener is not None:
+                    asyncio.create_task(self._run_handler(listener, received, typ, data))
             dict_ = self.listeners.get(typ)
             if dict_:
                 for listener in dict_.values():
-                    asyncio.create_task(listener(data))
+                    asyncio.create_task(self._run_handler(listener, received, data))
+
+    async def _run_handler(self, handler, received, *args):
+        self.dispatch_latency.observe(asyncio.get_running_loop().time() - received)
+        await handler(*args)
 
     def register_listener(self, event, tag, listener):
         """Register a listener to listen to Discord gateway dispatch events.
@@ -186,10 +237,28 @@ class Client:
             return True
         return False
 
+    def register_reaction_listener(self, message_id, listener):
+        """Register a listener to reactions being added to or removed from a message.
+
+        :param message_id: the ID of the message
+        :param listener: an awaitable listener, called with the event type and data
+        """
+        if message_id in self.reaction_listeners:
+            raise KeyError(f'Another reaction listener for message {message_id} exists')
+        self.reaction_listeners[message_id] = listener
+
+    def unregister_reaction_listener(self, message_id):
+        """Unregister the listener to reactions on a message.
+
+        :param message_id: the ID of the message
+        :return: whether a listener for the message was found and removed
+        """
+        return self.reaction_listeners.pop(message_id, None) is not None
+
     async def send_message(self, message, channel_id):
         """Send a message on Discord.
 
-        :param message: the message as a dict
+        :param message: the message as a dict, or serialized as JSON ``bytes``
         :param channel_id: the channel to send the message to
         :return: the sent Message object
         """
@@ -202,7 +271,8 @@ class Client:
 
         :param channel_id: the channel ID where the message exists
         :param message_id: the ID of the message
-        :param partial_message: the partial message to replace the existing message
+        :param partial_message: the partial message to replace the existing message, as a dict or serialized as JSON
+                                ``bytes``
         :return: the updated Message object
         """
         self.logger.info(f'Editing messge to channel {channel_id}')
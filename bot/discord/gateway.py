@@ -0,0 +1,449 @@
+import asyncio
+import logging
+import platform
+import random
+import re
+import time
+import zlib
+from enum import IntEnum, IntFlag
+
+import aiohttp
+
+from .. import json_codec
+from ..metrics import REGISTRY
+from .backoff import ExponentialBackoff
+
+
+class Opcode(IntEnum):
+    DISPATCH = 0
+    HEARTBEAT = 1
+    IDENTIFY = 2
+    STATUS_UPDATE = 3
+    VOICE_STATE_UPDATE = 4
+    RESUME = 6
+    RECONNECT = 7
+    REQUEST_GUILD_MEMBERS = 8
+    INVALID_SESSION = 9
+    HELLO = 10
+    HEARTBEAT_ACK = 11
+
+
+class CloseCode(IntEnum):
+    # This list is not exhaustive.
+    UNKNOWN_ERROR = 4000
+    AUTHENTICATION_FAILED = 4004
+    INVALID_SEQ = 4007
+    SESSION_TIMEOUT = 4009
+    INVALID_SHARD = 4010
+    SHARDING_REQUIRED = 4011
+    INVALID_API_VERSION = 4012
+    INVALID_INTENTS = 4013
+    DISALLOWED_INTENTS = 4014
+
+
+# Reconnecting will not help after these.
+FATAL_CLOSE_CODES = (
+    CloseCode.AUTHENTICATION_FAILED,
+    CloseCode.INVALID_SHARD,
+    CloseCode.SHARDING_REQUIRED,
+    CloseCode.INVALID_API_VERSION,
+    CloseCode.INVALID_INTENTS,
+    CloseCode.DISALLOWED_INTENTS,
+)
+# The session cannot be resumed after these.
+SESSION_CLOSE_CODES = (
+    CloseCode.INVALID_SEQ,
+    CloseCode.SESSION_TIMEOUT,
+)
+
+
+class Intent(IntFlag):
+    # This list is not exhaustive.
+    GUILDS = 1 << 0
+    GUILD_MEMBERS = 1 << 1
+    GUILD_PRESENCES = 1 << 8
+    GUILD_MESSAGES = 1 << 9
+    GUILD_MESSAGE_REACTIONS = 1 << 10
+    GUILD_MESSAGE_TYPING = 1 << 11
+    DIRECT_MESSAGES = 1 << 12
+    DIRECT_MESSAGE_REACTIONS = 1 << 13
+    DIRECT_MESSAGE_TYPING = 1 << 14
+
+
+class EventType:
+    # This list is not exhaustive.
+    READY = 'READY'
+    RESUMED = 'RESUMED'
+    CHANNEL_CREATE = 'CHANNEL_CREATE'
+    CHANNEL_UPDATE = 'CHANNEL_UPDATE'
+    CHANNEL_DELETE = 'CHANNEL_DELETE'
+    GUILD_CREATE = 'GUILD_CREATE'
+    GUILD_UPDATE = 'GUILD_UPDATE'
+    GUILD_DELETE = 'GUILD_DELETE'
+    MESSAGE_CREATE = 'MESSAGE_CREATE'
+    MESSAGE_UPDATE = 'MESSAGE_UPDATE'
+    MESSAGE_DELETE = 'MESSAGE_DELETE'
+    PRESENCE_UPDATE = 'PRESENCE_UPDATE'
+    TYPING_START = 'TYPING_START'
+    MESSAGE_REACTION_ADD = 'MESSAGE_REACTION_ADD'
+    MESSAGE_REACTION_REMOVE = 'MESSAGE_REACTION_REMOVE'
+
+
+# Discord sends the event type and sequence number ahead of the data, which allows reading them without decoding the
+# payload. Messages that do not match are fully decoded.
+PAYLOAD_HEADER_RE = re.compile(r'\{"t":\s*(?:null|"(\w+)"),\s*"s":\s*(?:null|(\d+)),\s*"op":\s*(\d+),')
+
+# Every complete zlib-stream message ends with this flush marker.
+ZLIB_SUFFIX = b'\x00\x00\xff\xff'
+
+
+HEARTBEAT_RTT = REGISTRY.histogram('discord_heartbeat_rtt_seconds', 'Round trip time of gateway heartbeats', ['shard'])
+MISSED_ACKS = REGISTRY.counter('discord_heartbeat_missed_acks_total',
+                               'Heartbeats not acknowledged before the next was due', ['shard'])
+CONNECTS = REGISTRY.counter('discord_gateway_connects_total', 'Connections made to the gateway', ['shard'])
+
+
+class GatewayError(Exception):
+    """Represents an error after which the gateway connection cannot be re-established."""
+
+
+class IdentifyLimiter:
+    """Limits the rate at which shards identify.
+
+    Discord allows one identify every 5 seconds per bucket, where the bucket of a shard is its ID modulo the
+    ``max_concurrency`` of the bot. A shard takes the slot of its bucket before it connects, so that it does not wait
+    while its connection is open, and holds it until it identifies or gives up.
+    """
+
+    INTERVAL = 5
+
+    def __init__(self, max_concurrency=1):
+        self.max_concurrency = max_concurrency
+        self._locks = {}
+        self._last_identify = {}
+
+    async def acquire(self, shard_id):
+        """Wait until the shard with the given ID may identify, and take the slot of its bucket until ``release``."""
+        key = shard_id % self.max_concurrency
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        await lock.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            last_identify = self._last_identify.get(key)
+            if last_identify is not None:
+                delay = last_identify + self.INTERVAL - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        except BaseException:
+            lock.release()
+            raise
+
+    def release(self, shard_id, identified):
+        """Release the slot taken by the shard with the given ID.
+
+        :param identified: whether the shard identified, which starts the interval before the next identify
+        """
+        key = shard_id % self.max_concurrency
+        if identified:
+            self._last_identify[key] = asyncio.get_running_loop().time()
+        self._locks[key].release()
+
+
+class Shard:
+    """A connection to the Discord gateway, which receives the events of the guilds belonging to one shard.
+
+    Dispatch events are passed on to the client. When the connection drops, or a heartbeat is not acknowledged before
+    the next one is due, the shard reconnects after a jittered exponential backoff and resumes its session if possible.
+    """
+
+    def __init__(self, client, shard_id, shard_count, identify_limiter):
+        """
+        :param client: the ``Client`` the shard belongs to
+        :param shard_id: the ID of the shard
+        :param shard_count: the total number of shards of the bot
+        :param identify_limiter: the ``IdentifyLimiter`` shared by the shards of the client
+        """
+        self.client = client
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.identify_limiter = identify_limiter
+        self.session_id = None
+        self.last_seq = None
+        self._heartbeat = None
+        self._heartbeat_sent = None
+        self._holds_identify = False
+        self._backoff = ExponentialBackoff()
+
+        # Health metrics.
+        self.latency = None
+        self.heartbeat_rtt = HEARTBEAT_RTT.labels(str(shard_id))
+        self.missed_acks = MISSED_ACKS.labels(str(shard_id))
+        self.connects = CONNECTS.labels(str(shard_id))
+        self.logger = logging.getLogger(f'{self.__class__.__qualname__}.{shard_id}')
+
+    async def run(self, socket_url=None):
+        """Connect to the gateway and run forever. Only raises ``GatewayError`` if the connection cannot be
+        re-established.
+
+        :param socket_url: the gateway URL, fetched from Discord if ``None``
+        """
+        while True:
+            try:
+                if socket_url is None:
+                    socket_url = (await self.client.get_gateway())['url']
+                await self._run_once(socket_url)
+            except (asyncio.CancelledError, GatewayError):
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as ex:
+                self.logger.warning(f'Gateway connection failed: {ex!r}')
+                # The gateway URL may have changed.
+                socket_url = None
+            except Exception as ex:
+                # Such as a malformed message, the connection is re-established rather than taking down the bot.
+                self.logger.exception(f'Exception in gateway connection: {ex!r}, reconnecting regardless')
+            delay = self._backoff.next_delay()
+            self.logger.info(f'Reconnecting in {delay:.1f}s')
+            await asyncio.sleep(delay)
+
+    async def _run_once(self, socket_url):
+        """Connect to the gateway and handle messages until the connection is closed."""
+        url = f'{socket_url}?v=6&encoding=json'
+        if self.client.compress:
+            url += '&compress=zlib-stream'
+        # The zlib context is shared by all messages of a connection, and a message may be split across frames.
+        inflator = zlib.decompressobj()
+        buffer = bytearray()
+        if self.session_id is None or self.last_seq is None:
+            # The session cannot be resumed, so wait for the turn to identify before connecting.
+            await self.identify_limiter.acquire(self.shard_id)
+            self._holds_identify = True
+        try:
+            async with self.client.get_gateway_session().ws_connect(url) as ws:
+                if self.client.start_time is None:
+                    self.client.start_time = time.time()
+                self.connects.inc()
+                self.logger.info('Websocket connected')
+                loop = asyncio.get_running_loop()
+                async for msg in ws:
+                    received = loop.time()
+                    if msg.type == aiohttp.WSMsgType.ERROR:
+                        self.logger.error(f'Websocket error response: {msg.data}')
+                        break
+                    elif msg.type == aiohttp.WSMsgType.TEXT:
+                        await self._handle_message(ws, msg.data, received)
+                    elif msg.type == aiohttp.WSMsgType.BINARY:
+                        buffer.extend(msg.data)
+                        if buffer[-4:] != ZLIB_SUFFIX:
+                            continue
+                        data = inflator.decompress(buffer).decode()
+                        buffer.clear()
+                        await self._handle_message(ws, data, received)
+                    else:
+                        self.logger.warning(f'Unhandled type: {msg.type}, {msg.data}')
+        finally:
+            if self._heartbeat is not None:
+                self._heartbeat.cancel()
+                self._heartbeat = None
+            if self._holds_identify:
+                self._release_identify(identified=False)
+
+        self.logger.warning(f'Websocket closed with code {ws.close_code}')
+        if ws.close_code in FATAL_CLOSE_CODES:
+            raise GatewayError(f'Shard {self.shard_id} websocket closed with code {ws.close_code}')
+        if ws.close_code in SESSION_CLOSE_CODES:
+            self._invalidate_session()
+
+    def _release_identify(self, identified):
+        self._holds_identify = False
+        self.identify_limiter.release(self.shard_id, identified)
+
+    def _invalidate_session(self):
+        self.logger.info('Session invalidated')
+        self.session_id = None
+        self.last_seq = None
+
+    async def _handle_message(self, ws, msg, received):
+        """Handle a websocket message.
+
+        Dispatches of events that nothing handles are dropped without decoding their data.
+
+        :param received: the event loop time at which the message was received
+        """
+        match = PAYLOAD_HEADER_RE.match(msg)
+        if match is not None:
+            typ, seq, op = match.groups()
+            if int(op) == Opcode.DISPATCH and not self._is_handled(typ):
+                self.last_seq = int(seq)
+                self.logger.debug(f'Skipped: {op} {typ}')
+                return
+
+        msg = json_codec.loads(msg)
+        op = msg['op']
+        if msg.get('s'):
+            self.last_seq = msg['s']
+        typ = msg.get('t')
+        data = msg.get('d')
+        self.logger.debug(f'Received: {op} {typ}')
+        if op == Opcode.HELLO:
+            self.logger.info(data)
+            self._heartbeat_sent = None
+            self._heartbeat = asyncio.create_task(self._heartbeat_task(ws, data['heartbeat_interval']))
+            if self.session_id is not None and self.last_seq is not None:
+                await self._resume(ws)
+            else:
+                await self._identify(ws)
+        elif op == Opcode.HEARTBEAT_ACK:
+            if self._heartbeat_sent is not None:
+                self.latency = received - self._heartbeat_sent
+                self.heartbeat_rtt.observe(self.latency)
+                self._heartbeat_sent = None
+            self.logger.info(f'Heartbeat-ack received, latency {self.latency}')
+        elif op == Opcode.HEARTBEAT:
+            await ws.send_json({'op': Opcode.HEARTBEAT, 'd': self.last_seq}, dumps=json_codec.dumps)
+        elif op == Opcode.RECONNECT:
+            self.logger.info('Reconnect requested')
+            # Closing with a code other than 1000 keeps the session resumable.
+            await ws.close(code=CloseCode.UNKNOWN_ERROR)
+        elif op == Opcode.INVALID_SESSION:
+            self.logger.info(f'Invalid session, resumable: {data}')
+            if not data:
+                # Reconnect to identify, so that the turn to identify is not awaited while the connection is open.
+                self._invalidate_session()
+                await ws.close(code=CloseCode.UNKNOWN_ERROR)
+                return
+            # Discord asks to wait between 1 and 5 seconds before trying again.
+            await asyncio.sleep(random.uniform(1, 5))
+            await self._resume(ws)
+        elif op == Opcode.DISPATCH:
+            self.logger.debug('Handling dispatch')
+            await self._handle_dispatch(typ, data, received)
+        else:
+            self.logger.info(f'Did not handle opcode with data: {data}')
+
+    async def _identify(self, ws):
+        """Identify to start a new session."""
+        client = self.client
+        reply = {
+            'op': Opcode.IDENTIFY,
+            'd': {
+                'token': client.token,
+                'properties': {
+                    '$os': platform.platform(terse=1),
+                },
+                # Payload compression is redundant with transport compression.
+                'compress': False,
+                'guild_subscriptions': client.guild_subscriptions,
+                'shard': [self.shard_id, self.shard_count],
+            },
+        }
+        if client.intents is not None:
+            reply['d']['intents'] = int(client.intents)
+        if client.activity_name:
+            reply['d']['presence'] = {
+                'game': {
+                    'name': client.activity_name,
+                    'type': 0,
+                },
+                'status': 'online',
+                'since': None,
+                'afk': False,
+            }
+        if not self._holds_identify:
+            await self.identify_limiter.acquire(self.shard_id)
+            self._holds_identify = True
+        self.logger.info('Identifying')
+        try:
+            await ws.send_json(reply, dumps=json_codec.dumps)
+        finally:
+            self._release_identify(identified=True)
+
+    async def _resume(self, ws):
+        """Resume the previous session, Discord replays the events missed since ``last_seq``."""
+        reply = {
+            'op': Opcode.RESUME,
+            'd': {
+                'token': self.client.token,
+                'session_id': self.session_id,
+                'seq': self.last_seq,
+            },
+        }
+        self.logger.info(f'Resuming session {self.session_id} from {self.last_seq}')
+        await ws.send_json(reply, dumps=json_codec.dumps)
+
+    async def _heartbeat_task(self, ws, interval_ms):
+        """Run forever, send a heartbeat through the websocket ``ws`` every ``interval_ms`` milliseconds.
+
+        If the previous heartbeat was not acknowledged, or a heartbeat cannot be sent, the connection is assumed to be
+        dead and is closed instead.
+        """
+        interval_sec = interval_ms / 1000
+        data = {'op': Opcode.HEARTBEAT}
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await asyncio.sleep(interval_sec)
+                if self._heartbeat_sent is not None:
+                    self.missed_acks.inc()
+                    self.logger.warning('Heartbeat not acknowledged, reconnecting')
+                    break
+                data['d'] = self.last_seq
+                self.logger.info(f'Sending heartbeat {self.last_seq}')
+                self._heartbeat_sent = loop.time()
+                await ws.send_json(data, dumps=json_codec.dumps)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.logger.exception(f'Exception in sending heartbeat: {ex!r}, reconnecting')
+        await ws.close(code=CloseCode.UNKNOWN_ERROR)
+
+    def _is_handled(self, typ):
+        """Whether a dispatch event of type ``typ`` is handled by the shard or the client."""
+        return typ in (EventType.READY, EventType.RESUMED) or self.client.is_handled(typ)
+
+    async def _handle_dispatch(self, typ, data, received):
+        """Handle a websocket dispatch event."""
+        if typ == EventType.READY:
+            self.session_id = data['session_id']
+            self._backoff.reset()
+        elif typ == EventType.RESUMED:
+            self._backoff.reset()
+            self.logger.info('Session resumed')
+        await self.client.handle_dispatch(self, typ, data, received)
+
+
+class ShardManager:
+    """Runs all shards of a client in this process.
+
+    Splitting the shards across processes is not supported: profiles are refreshed from the subscriptions held by one
+    process, and identifies are only limited among the shards of a process.
+    """
+
+    def __init__(self, client, shard_count=None):
+        """
+        :param client: the ``Client`` the shards belong to
+        :param shard_count: the total number of shards, the count recommended by Discord if ``None``
+        """
+        self.client = client
+        self.shard_count = shard_count
+        self.shards = []
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    async def run(self):
+        """Run the shards forever. Raises ``GatewayError`` if any shard cannot be reconnected."""
+        gateway = await self.client.get_gateway()
+        shard_count = self.shard_count or gateway.get('shards', 1)
+        shard_ids = range(shard_count)
+        start_limit = gateway.get('session_start_limit', {})
+        if start_limit.get('remaining', len(shard_ids)) < len(shard_ids):
+            self.logger.warning(f'Only {start_limit["remaining"]} session starts remain, resetting in '
+                                f'{start_limit["reset_after"]}ms')
+        identify_limiter = IdentifyLimiter(start_limit.get('max_concurrency', 1))
+        self.shards = [Shard(self.client, shard_id, shard_count, identify_limiter) for shard_id in shard_ids]
+        self.logger.info(f'Running shards {list(shard_ids)} of {shard_count}')
+
+        tasks = [asyncio.create_task(shard.run(gateway['url'])) for shard in self.shards]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import re
+import time
+
+# Discord rate limits routes per major parameter, so only the IDs of channels, guilds and webhooks are kept in the
+# bucket key. Other IDs and reaction emojis are replaced by placeholders.
+_MINOR_ID_RE = re.compile(r'(?<!channels)(?<!guilds)(?<!webhooks)/\d+')
+_EMOJI_RE = re.compile(r'/reactions/[^/]+')
+_ID_RE = re.compile(r'/\d+')
+
+
+def get_route_key(method, path):
+    """Returns the key of the rate limit bucket for the given method and API path."""
+    route = _MINOR_ID_RE.sub('/{id}', path)
+    route = _EMOJI_RE.sub('/reactions/{emoji}', route)
+    return f'{method} {route}'
+
+
+def get_route_template(method, path):
+    """Returns the route of the given method and API path with all IDs and emojis replaced by placeholders."""
+    route = _ID_RE.sub('/{id}', path)
+    route = _EMOJI_RE.sub('/reactions/{emoji}', route)
+    return f'{method} {route}'
+
+
+class Bucket:
+    """Rate limit state of a single route.
+
+    Requests are queued on a lock. While the limits of the route are unknown, which is the case until the first
+    response arrives, the lock is held for the duration of the request so that requests are sent one at a time.
+    The same happens for the first request of every new window. Once the limits are known, the lock is only held while
+    waiting for a slot, allowing up to the remaining number of requests to be in flight together.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.known = False
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self._lock = asyncio.Lock()
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    async def acquire(self):
+        """Wait for a free slot in the bucket.
+
+        :return: whether the bucket remains locked, in which case ``release`` must be called after the response is
+                 received
+        """
+        await self._lock.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            if self.reset_at is not None:
+                if self.remaining == 0:
+                    delay = self.reset_at - loop.time()
+                    if delay > 0:
+                        self.logger.info(f'Bucket {self.key} exhausted, waiting {delay:.2f}s')
+                        await asyncio.sleep(delay)
+                if loop.time() >= self.reset_at:
+                    # A new window has started, its reset time is learned from the next response.
+                    self.remaining = self.limit
+                    self.reset_at = None
+                    self.known = False
+        except BaseException:
+            # Such as the waiter being cancelled, which must not leave the bucket locked.
+            self._lock.release()
+            raise
+        if not self.known:
+            return True
+        if self.remaining is not None:
+            self.remaining -= 1
+        self._lock.release()
+        return False
+
+    def release(self, locked):
+        """Release the bucket if it was left locked by ``acquire``."""
+        if locked:
+            self._lock.release()
+
+    def update(self, headers):
+        """Update the bucket from the rate limit headers of a response."""
+        self.known = True
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is None:
+            # The route is not rate limited.
+            return
+        loop = asyncio.get_running_loop()
+        self.limit = int(headers['X-RateLimit-Limit'])
+        remaining = int(remaining)
+        # Responses of requests sent concurrently do not account for each other, so never trust a higher count than
+        # what was tracked locally.
+        self.remaining = remaining if self.remaining is None else min(self.remaining, remaining)
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if reset_after is not None:
+            reset_after = float(reset_after)
+        else:
+            reset_after = max(float(headers['X-RateLimit-Reset']) - time.time(), 0)
+        self.reset_at = loop.time() + reset_after
+
+    def block(self, delay):
+        """Mark the bucket exhausted for ``delay`` seconds."""
+        loop = asyncio.get_running_loop()
+        self.known = True
+        self.remaining = 0
+        self.reset_at = loop.time() + delay
+
+
+class RateLimiter:
+    """Keeps track of Discord rate limits, both per route and global."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._global_open = None
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    def get_bucket(self, method, path):
+        """Returns the bucket for the given method and API path."""
+        key = get_route_key(method, path)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = Bucket(key)
+        return bucket
+
+    def _get_global_event(self):
+        # Created lazily so that it is bound to the running event loop.
+        if self._global_open is None:
+            self._global_open = asyncio.Event()
+            self._global_open.set()
+        return self._global_open
+
+    async def wait_global(self):
+        """Wait until the global rate limit is not in effect."""
+        await self._get_global_event().wait()
+
+    def block_global(self, delay):
+        """Block all requests for ``delay`` seconds."""
+        event = self._get_global_event()
+        if not event.is_set():
+            return
+        self.logger.warning(f'Global rate limit hit, blocking requests for {delay:.2f}s')
+        event.clear()
+        asyncio.get_running_loop().call_later(delay, event.set)
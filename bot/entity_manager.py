@@ -1,5 +1,7 @@
+import asyncio
 import logging
 
+from .db.write_behind import WriteBehindQueue
 from .models import User
 from .discord import Channel
 
@@ -7,35 +9,153 @@ from .discord import Channel
 class EntityManager:
     """Responsible for managing users and channels.
 
-     Loads entities from the database on start up, and saves them to the database on modification.
+     Loads entities from the database on start up, and saves them to the database on modification. Modified site
+     profiles are saved individually in batches in the background, see ``WriteBehindQueue``. Entities can also be
+     restored from a snapshot on start up, in which case they are loaded from the database in the background.
     """
 
-    def __init__(self, db_connector):
+    def __init__(self, db_connector, write_interval=1, write_batch_size=500):
+        """
+        :param db_connector: the connector of the database to load and save entities with
+        :param write_interval: the maximum time in seconds between modifying a site profile and saving it
+        :param write_batch_size: the maximum number of site profiles saved together
+        """
         self.db_connector = db_connector
+        self._profile_writes = WriteBehindQueue(self._write_profiles, flush_interval=write_interval,
+                                                batch_size=write_batch_size)
         self.users = None
         self._user_id_to_user = None
+        self._handle_index = None
         self._channel_id_to_channel = None
+        # The IDs of restored entities modified before they are loaded from the database, which are newer than the
+        # loaded ones.
+        self._modified_user_ids = None
+        self._modified_channel_ids = None
+        # Loads entities that are not restored from a snapshot, which must be awaited before they are used.
+        self._load_task = None
         self.logger = logging.getLogger(self.__class__.__qualname__)
 
     async def run(self):
-        """Connects to the database and loads users and channels."""
+        """Connects to the database and starts loading users and channels in the background, see
+        ``wait_until_loaded``.
+
+        If entities were restored from a snapshot, they can be used meanwhile, and are kept if loading fails.
+        """
         self.logger.debug('Running EntityManager...')
         self.db_connector.connect()
+        if self.users is None:
+            self._load_task = asyncio.create_task(self._load())
+        else:
+            asyncio.create_task(self._load_in_background())
+
+    async def wait_until_loaded(self):
+        """Waits until users and channels can be used. Raises the exception of loading them if that failed and there
+        was no snapshot to fall back on.
+        """
+        if self._load_task is not None:
+            # Shielded so that a cancelled waiter does not cancel loading for the others.
+            await asyncio.shield(self._load_task)
+
+    async def _load(self):
+        await self.db_connector.migrate_site_profiles()
         await self._load_users()
         await self._load_channels()
+        self._profile_writes.start()
+
+    async def _load_in_background(self):
+        try:
+            await self._load()
+        except Exception:
+            self.logger.exception('Failed to load entities from db, continuing with the snapshot')
+            self._modified_user_ids = self._modified_channel_ids = None
+            self._profile_writes.start()
+
+    def restore(self, state):
+        """Restores users and channels from the state of a snapshot, see ``get_state``."""
+        self._set_users([User.from_dict(user_d) for user_d in state['users']])
+        channels = [Channel(**channel_d) for channel_d in state['channels']]
+        self._channel_id_to_channel = {channel.id: channel for channel in channels}
+        self._modified_user_ids = set()
+        self._modified_channel_ids = set()
+        self.logger.info(f'Restored {len(self.users)} users and {len(channels)} channels from snapshot')
+
+    def get_state(self):
+        """Returns the users and channels as a ``dict`` of plain data to be saved in a snapshot."""
+        return {
+            'users': [user.to_dict() for user in self.users],
+            'channels': [channel.to_dict() for channel in self._channel_id_to_channel.values()],
+        }
+
+    async def close(self):
+        """Saves all modified site profiles that have not been saved yet."""
+        await self._profile_writes.close()
+
+    def _queue_profile_write(self, user, site_tag):
+        # The profile is read when it is written, so only its latest state is saved.
+        self._profile_writes.put((user.discord_id, site_tag), (user, site_tag))
+
+    async def _write_profiles(self, items):
+        updates = []
+        for user, site_tag in items:
+            profile = user.get_profile_for_site(site_tag)
+            profile_d = None if profile is None else profile.to_dict()
+            updates.append((user.discord_id, user.dm_channel_id, site_tag, profile_d))
+        await self.db_connector.update_user_site_profiles(updates)
+        self.logger.info(f'Saved {len(updates)} site profiles to db')
 
     async def _load_users(self):
         users = await self.db_connector.get_all_users()
-        self.users = [User.from_dict(user) for user in users]
-        self._user_id_to_user = {user.discord_id: user for user in self.users}
+        users = [User.from_dict(user) for user in users]
+        if self._modified_user_ids is not None:
+            # Keep restored users that were modified meanwhile, their changes are yet to be saved.
+            users = [user for user in users if user.discord_id not in self._modified_user_ids]
+            users += [self._user_id_to_user[user_id] for user_id in self._modified_user_ids]
+        self._modified_user_ids = None
+        self._set_users(users)
         self.logger.info(f'Loaded {len(self.users)} users from db')
 
     async def _load_channels(self):
         channels = await self.db_connector.get_all_channels()
         channels = [Channel(**channel_d) for channel_d in channels]
+        if self._modified_channel_ids is not None:
+            channels = [channel for channel in channels if channel.id not in self._modified_channel_ids]
+            channels += [self._channel_id_to_channel[channel_id] for channel_id in self._modified_channel_ids]
+        self._modified_channel_ids = None
         self._channel_id_to_channel = {channel.id: channel for channel in channels}
         self.logger.info(f'Loaded {len(channels)} channels from db')
 
+    def _set_users(self, users):
+        self.users = users
+        self._user_id_to_user = {user.discord_id: user for user in self.users}
+        self._handle_index = {}
+        for user in self.users:
+            for profile in user.site_profiles:
+                self._index_add(user, profile)
+
+    def _mark_user_modified(self, user_id):
+        if self._modified_user_ids is not None:
+            self._modified_user_ids.add(user_id)
+
+    def _index_add(self, user, profile):
+        site_index = self._handle_index.setdefault(profile.site_tag, {})
+        site_index.setdefault(profile.handle, set()).add(user)
+
+    def _index_remove(self, user, profile):
+        site_index = self._handle_index.get(profile.site_tag, {})
+        users = site_index.get(profile.handle)
+        if users is not None:
+            users.discard(user)
+            if not users:
+                del site_index[profile.handle]
+
+    def get_site_handles(self, site_tag):
+        """Returns a list of the distinct handles subscribed to on the site with the given tag."""
+        return list(self._handle_index.get(site_tag, {}))
+
+    def get_site_subscribers(self, site_tag, handle):
+        """Returns a list of users subscribed to the given handle on the site with the given tag."""
+        return list(self._handle_index.get(site_tag, {}).get(handle, ()))
+
     def get_user(self, user_id):
         """Looks up and returns a user by the user's Discord id, ``None`` if there is no such user"""
         return self._user_id_to_user.get(user_id)
@@ -49,26 +169,33 @@ class EntityManager:
             user = User(user_id, dm_channel_id)
             self.users.append(user)
             self._user_id_to_user[user_id] = user
+            self._mark_user_modified(user_id)
 
     async def update_user_site_profile(self, user_id, profile):
         """Creates or updates a user's site profile to the given profile. Returns whether the name
         or rating changed.
         """
         user = self._user_id_to_user.get(user_id)
+        old_profile = user.get_profile_for_site(profile.site_tag)
         changed_any, changed_name_or_rating = user.update_profile(profile)
+        if old_profile is None or old_profile.handle != profile.handle:
+            if old_profile is not None:
+                self._index_remove(user, old_profile)
+            self._index_add(user, profile)
         if changed_any:
-            await self.db_connector.put_user(user.to_dict())
-            self.logger.info(f'Saved user with id {user_id} to db')
+            self._mark_user_modified(user_id)
+            self._queue_profile_write(user, profile.site_tag)
         return changed_name_or_rating
 
     async def delete_user_site_profile(self, user_id, site_tag):
         """Deletes a user's site profile associated with the given site tag."""
         user = self._user_id_to_user.get(user_id)
+        profile = user.get_profile_for_site(site_tag)
         changed = user.delete_profile(site_tag)
-        # TODO: Optimize to update instead of replace.
         if changed:
-            await self.db_connector.put_user(user.to_dict())
-            self.logger.info(f'Saved user with id {user_id} to db')
+            self._index_remove(user, profile)
+            self._mark_user_modified(user_id)
+            self._queue_profile_write(user, site_tag)
         return changed
 
     def get_channel(self, channel_id):
@@ -78,5 +205,7 @@ class EntityManager:
     async def save_channel(self, channel):
         """Saves the given channel."""
         self._channel_id_to_channel[channel.id] = channel
+        if self._modified_channel_ids is not None:
+            self._modified_channel_ids.add(channel.id)
         await self.db_connector.put_channel(channel.to_dict())
         self.logger.info(f'Saved channel with id {channel.id} to db')
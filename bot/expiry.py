@@ -0,0 +1,81 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+
+class ExpiryScheduler:
+    """Calls a callback for each key once its deadline passes, with a single timer for all keys.
+
+    Deadlines are kept in a heap. Entries that are superseded by a new deadline or cancelled are left in the heap and
+    skipped when they surface, so changing a deadline costs a push and never a timer. The event loop timer is only
+    re-armed when the earliest deadline changes.
+    """
+
+    def __init__(self):
+        self._deadlines = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._handle = None
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay, callback, extend_only=False):
+        """Schedule ``callback`` to be called without arguments after ``delay`` seconds, replacing any deadline of the
+        key.
+
+        :param key: the key to identify the deadline by
+        :param delay: the delay in seconds
+        :param callback: the function to call when the deadline passes
+        :param extend_only: whether to keep an existing deadline if it is later
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        current = self._deadlines.get(key)
+        if extend_only and current is not None and current[0] >= deadline:
+            return
+        self._deadlines[key] = deadline, callback
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+        if self._handle is None or deadline < self._handle.when():
+            self._arm(loop)
+
+    def cancel(self, key):
+        """Cancel the deadline of a key. Returns whether the key had a deadline."""
+        return self._deadlines.pop(key, None) is not None
+
+    def _compact(self):
+        """Drop superseded and cancelled entries from the heap."""
+        self._heap = [(deadline, count, key) for deadline, count, key in self._heap
+                      if key in self._deadlines and self._deadlines[key][0] == deadline]
+        heapq.heapify(self._heap)
+
+    def _arm(self, loop):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._heap:
+            self._handle = loop.call_at(self._heap[0][0], self._expire)
+
+    def _expire(self):
+        self._handle = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            current = self._deadlines.get(key)
+            if current is None or current[0] != deadline:
+                # Superseded or cancelled.
+                continue
+            del self._deadlines[key]
+            try:
+                current[1]()
+            except Exception as ex:
+                self.logger.exception(f'Exception in expiry callback of {key}: {ex}, continuing regardless')
+        self._arm(loop)
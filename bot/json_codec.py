@@ -0,0 +1,31 @@
+"""JSON encoding and decoding with the fastest library installed.
+
+``orjson`` is preferred over ``ujson``, and the standard library ``json`` is used if neither is installed.
+"""
+import json
+
+
+def _find_codecs():
+    codecs = {'json': (json.loads, json.dumps)}
+    try:
+        import ujson
+        codecs['ujson'] = (ujson.loads, ujson.dumps)
+    except ImportError:
+        pass
+    try:
+        import orjson
+
+        def orjson_dumps(obj):
+            # orjson encodes to bytes, while aiohttp expects str.
+            return orjson.dumps(obj).decode()
+
+        codecs['orjson'] = (orjson.loads, orjson_dumps)
+    except ImportError:
+        pass
+    return codecs
+
+
+# Maps the names of the installed libraries to their (loads, dumps) functions.
+CODECS = _find_codecs()
+BACKEND = next(name for name in ('orjson', 'ujson', 'json') if name in CODECS)
+loads, dumps = CODECS[BACKEND]
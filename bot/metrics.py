@@ -0,0 +1,277 @@
+import asyncio
+import bisect
+import functools
+import logging
+import time
+
+from aiohttp import web
+
+# Upper bounds of histogram buckets in seconds, suited to network round trips and event loop delays.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Count:
+    """A count that only goes up."""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """Counts observed values in buckets, along with their total count, sum and maximum."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: the increasing upper bounds of the buckets, a last bucket without bound is added
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        """Record a value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Returns an upper bound for the ``q``-quantile of the observed values, or None if there are none."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        """Returns the histogram as a dict with the cumulative count of each bucket, keyed by its upper bound."""
+        cumulative = {}
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            cumulative[bound] = seen
+        return {
+            'buckets': cumulative,
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+        }
+
+
+class _Family:
+    """A metric with one child per combination of label values, like a Prometheus metric family."""
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *labelvalues):
+        """Returns the child for the given label values, creating it if necessary."""
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f'Expected values for labels {self.labelnames}, found {labelvalues}')
+        child = self._children.get(labelvalues)
+        if child is None:
+            child = self._children[labelvalues] = self._new_child()
+        return child
+
+    def expose(self):
+        """Returns the lines of the metric in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}']
+        for labelvalues, child in self._children.items():
+            labels = list(zip(self.labelnames, labelvalues))
+            lines += self._expose_child(labels, child)
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError('This method must be overridden')
+
+    def _expose_child(self, labels, child):
+        raise NotImplementedError('This method must be overridden')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class CounterFamily(_Family):
+    TYPE = 'counter'
+
+    def _new_child(self):
+        return Count()
+
+    def _expose_child(self, labels, child):
+        return [f'{self.name}{_format_labels(labels)} {_format_value(child.value)}']
+
+
+class HistogramFamily(_Family):
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def _expose_child(self, labels, child):
+        data = child.to_dict()
+        lines = [f'{self.name}_bucket{_format_labels(labels + [("le", _format_value(bound))])} {count}'
+                 for bound, count in data['buckets'].items()]
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(data["sum"])}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {data["count"]}')
+        return lines
+
+
+class Registry:
+    """Holds metric families and exposes them in the Prometheus text format."""
+
+    def __init__(self):
+        self._families = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create and register a ``CounterFamily``."""
+        return self._register(CounterFamily(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a ``HistogramFamily``."""
+        return self._register(HistogramFamily(name, documentation, labelnames, buckets))
+
+    def _register(self, family):
+        if family.name in self._families:
+            raise KeyError(f'Another metric with name "{family.name}" exists')
+        self._families[family.name] = family
+        return family
+
+    def expose(self):
+        """Returns all metrics in the Prometheus text format."""
+        lines = []
+        for family in self._families.values():
+            lines += family.expose()
+        return '\n'.join(lines) + '\n'
+
+
+# The registry of all metrics of the bot.
+REGISTRY = Registry()
+
+LOOP_LAG = REGISTRY.histogram('bot_event_loop_lag_seconds', 'Delay of callbacks of the event loop after they are due')
+
+
+class LoopLagMonitor:
+    """Samples the lag of the event loop, the delay with which a callback runs after it is due.
+
+    A consistently high lag means that something is blocking the loop, which delays everything else, including replies
+    to Discord.
+    """
+
+    def __init__(self, interval=1):
+        """
+        :param interval: the interval between samples in seconds
+        """
+        self.interval = interval
+        self.histogram = LOOP_LAG.labels()
+        self.last = None
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    async def run(self):
+        """Run forever, taking a sample every ``interval`` seconds."""
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = loop.time() - due
+            self.histogram.observe(self.last)
+            if self.last > self.interval:
+                self.logger.warning(f'Event loop lagged by {self.last:.2f}s')
+
+
+class Timer:
+    """A context manager that records the duration of its body in a ``HistogramFamily``.
+
+    The last label is the outcome, which is ``success`` or ``error`` depending on whether an exception was raised,
+    unless set on the timer.
+    """
+
+    def __init__(self, family, *labelvalues):
+        """
+        :param family: the ``HistogramFamily`` to record in
+        :param labelvalues: the values of all labels except the outcome
+        """
+        self.family = family
+        self.labelvalues = labelvalues
+        self.outcome = None
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is asyncio.CancelledError:
+            return
+        outcome = self.outcome or ('error' if exc_type is not None else 'success')
+        self.family.labels(*self.labelvalues, outcome).observe(time.perf_counter() - self._start)
+
+
+def timed(family, *labelvalues):
+    """Decorates a coroutine function to record its duration and outcome with a ``Timer``."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with Timer(family, *labelvalues):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsServer:
+    """Serves the metrics of a registry over HTTP at ``/metrics``, for scraping by Prometheus."""
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    async def start(self):
+        """Start serving in the background."""
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.logger.info(f'Serving metrics on {self.host}:{self.port}')
+
+    async def close(self):
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self.registry.expose(), content_type='text/plain')
+
+
+def format_seconds(value):
+    """Formats a duration in seconds for display, in milliseconds."""
+    return 'n/a' if value is None else f'{value * 1000:.0f} ms'
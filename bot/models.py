@@ -92,17 +92,23 @@ class User:
 
     @classmethod
     def from_dict(cls, user_d):
-        """Creates and returns a user object from its ``dict`` representation."""
+        """Creates and returns a user object from its ``dict`` representation.
+
+        Site profiles may be a map keyed by site tag, or a list as stored before site profiles were keyed.
+        """
+        site_profiles = user_d.get('site_profiles', {})
+        if isinstance(site_profiles, dict):
+            site_profiles = site_profiles.values()
         return cls(
             user_d['discord_id'],
             user_d['dm_channel_id'],
-            [Profile.from_dict(profile_dict) for profile_dict in user_d['site_profiles']]
+            [Profile.from_dict(profile_dict) for profile_dict in site_profiles]
         )
 
     def to_dict(self):
-        """Returns a ``dict`` representing the user."""
+        """Returns a ``dict`` representing the user, with site profiles keyed by site tag."""
         return {
             'discord_id': self.discord_id,
             'dm_channel_id': self.dm_channel_id,
-            'site_profiles': [profile.to_dict() for profile in self.site_profiles]
+            'site_profiles': {profile.site_tag: profile.to_dict() for profile in self.site_profiles}
         }
@@ -1,54 +1,72 @@
 import asyncio
 import logging
 import math
-import time
 
-from .discord import EventType
+from . import json_codec
+from .expiry import ExpiryScheduler
 
 EMOJI_PREV = '\N{BLACK LEFT-POINTING TRIANGLE}'
 EMOJI_NEXT = '\N{BLACK RIGHT-POINTING TRIANGLE}'
 
 
-class Paginated:
-    """Represents a paginated message."""
+class Pages:
+    """The pages of a paginated message, rendered and serialized once.
+
+    Pages are never modified, so they can be shared by any number of ``Paginated`` messages showing the same content.
+    """
 
     def __init__(self, message, *, per_page):
         """
         :param message: the message to paginate; the fields in the message embed are paginated
         :param per_page: the number of fields to show per page
         """
-        self.message = message
-        self.fields = message['embed']['fields']
-        self.per_page = per_page
-        self.num_pages = math.ceil(len(self.fields) / per_page)
+        fields = message['embed']['fields']
+        self.num_pages = max(math.ceil(len(fields) / per_page), 1)
+        self._messages = []
+        self._embeds = []
+        for page_num in range(1, self.num_pages + 1):
+            end = page_num * per_page
+            embed = dict(message['embed'], fields=fields[end - per_page:end])
+            if self.num_pages > 1:
+                embed['footer'] = {'text': f'Page {page_num} / {self.num_pages}'}
+            self._messages.append(json_codec.dumps(dict(message, embed=embed)).encode())
+            self._embeds.append(json_codec.dumps({'embed': embed}).encode())
+
+    def get_message(self, page_num):
+        """Returns the serialized message showing the given page."""
+        return self._messages[page_num - 1]
+
+    def get_edit(self, page_num):
+        """Returns the serialized partial message that replaces the shown page with the given page."""
+        return self._embeds[page_num - 1]
+
+
+class Paginated:
+    """Represents a paginated message.
+
+    Page changes are not shown right away, but once no further change arrives within ``EDIT_DEBOUNCE`` seconds, so that
+    rapid flips cause a single edit of the final page. At most one edit of the message is in flight at a time.
+    """
+
+    EDIT_DEBOUNCE = 0.3
+
+    def __init__(self, pages):
+        """
+        :param pages: the ``Pages`` to show
+        """
+        self.pages = pages
+        self.num_pages = pages.num_pages
 
         self.bot = None
         self.cur_page = None
         self.sent_message = None
         self.time_delay = None
-        self.expire_handle = None
-        self.tag = self.__class__.__name__ + str(time.time())
+        # The page last sent to Discord, and the task that edits the message to show the current page.
+        self.shown_page = None
+        self._edit_task = None
+        self._last_change = None
         self.logger = logging.getLogger(self.__class__.__qualname__)
 
-    def _set_page(self, page_num):
-        """Set current page to ``page_num``."""
-        end = page_num * self.per_page
-        begin = end - self.per_page
-        self.cur_page = page_num
-        self.message['embed']['fields'] = self.fields[begin:end]
-        if self.num_pages > 1:
-            self.message['embed']['footer'] = {'text': f'Page {page_num} / {self.num_pages}'}
-
-    def schedule_unregister_after(self, time_delay):
-        """Schedule unregister after a delay if that is later than current expiry time."""
-        loop = asyncio.get_running_loop()
-        time_expire = loop.time() + time_delay
-        if self.expire_handle is not None:
-            if time_expire < self.expire_handle.when():
-                return
-            self.expire_handle.cancel()
-        self.expire_handle = loop.call_at(when=time_expire, callback=self.unregister)
-
     async def send(self, bot, channel_id, *, page_num=1, time_active, time_delay):
         """Send a paginated message.
 
@@ -59,54 +77,119 @@ class Paginated:
         :param time_delay: the time delay between last attempt to change pages and deactivation
         """
         self.bot = bot
-        self._set_page(page_num)
-        self.sent_message = await bot.client.send_message(self.message, channel_id)
+        self.cur_page = page_num
+        self.sent_message = await bot.client.send_message(self.pages.get_message(page_num), channel_id)
+        self.shown_page = page_num
         if self.num_pages <= 1:
             # No need to paginate.
             return
-        await asyncio.sleep(0.5)
         await self.bot.client.add_reaction(self.sent_message.channel_id, self.sent_message.id, EMOJI_PREV)
-        await asyncio.sleep(0.5)  # Delay to avoid 429
         await self.bot.client.add_reaction(self.sent_message.channel_id, self.sent_message.id, EMOJI_NEXT)
-        bot.client.register_listener(EventType.MESSAGE_REACTION_ADD, self.tag, self._on_reaction_add_or_remove)
-        bot.client.register_listener(EventType.MESSAGE_REACTION_REMOVE, self.tag, self._on_reaction_add_or_remove)
         self.logger.info(f'Paginating stuff')
         self.time_delay = time_delay
-        self.schedule_unregister_after(time_active)
+        bot.paginators.add(self, time_active)
 
-    async def _on_reaction_add_or_remove(self, data):
-        """Event listener that is triggered when a reaction is added or removed."""
+    async def _on_reaction_add_or_remove(self, typ, data):
+        """Event listener that is triggered when a reaction is added to or removed from the paginated message."""
         if data['user_id'] == self.bot.client.user['id']:
             return
-        if data['message_id'] != self.sent_message.id:
-            return
         emoji = data['emoji'].get('name')
         if emoji not in (EMOJI_PREV, EMOJI_NEXT):
             return
-        changed = False
         if emoji == EMOJI_PREV:
-            if self.cur_page > 1:
-                self._set_page(self.cur_page - 1)
-                changed = True
+            self.cur_page = max(self.cur_page - 1, 1)
         else:
-            if self.cur_page < self.num_pages:
-                self._set_page(self.cur_page + 1)
-                changed = True
-        if changed:
-            partial_message = {'embed': self.message['embed']}
-            await self.bot.client.edit_message(self.sent_message.channel_id, self.sent_message.id, partial_message)
+            self.cur_page = min(self.cur_page + 1, self.num_pages)
+        self._last_change = asyncio.get_running_loop().time()
+        if self.cur_page != self.shown_page and (self._edit_task is None or self._edit_task.done()):
+            self._edit_task = asyncio.create_task(self._show_current_page())
+        self.bot.paginators.extend(self, self.time_delay)
+
+    async def _show_current_page(self):
+        """Edit the message to show the current page once page changes settle, until the shown page is current."""
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._last_change + self.EDIT_DEBOUNCE - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            page_num = self.cur_page
+            if page_num == self.shown_page:
+                return
+            try:
+                await self.bot.client.edit_message(self.sent_message.channel_id, self.sent_message.id,
+                                                   self.pages.get_edit(page_num))
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                self.logger.exception(f'Exception in updating page: {ex}')
+                return
+            self.shown_page = page_num
             self.logger.debug(f'Updated page')
-        self.schedule_unregister_after(self.time_delay)
 
-    def unregister(self):
-        """Delete all reactions on paginated message to signify deactivation and remove registered listeners."""
-        self.logger.info('Removing paginator listeners')
-        asyncio.create_task(self.bot.client.delete_all_reactions(self.sent_message.channel_id, self.sent_message.id))
-        self.bot.client.unregister_listener(EventType.MESSAGE_REACTION_ADD, self.tag)
-        self.bot.client.unregister_listener(EventType.MESSAGE_REACTION_REMOVE, self.tag)
+
+class PaginationManager:
+    """Keeps track of the live paginated messages of a client and deactivates them when they expire.
+
+    The deadlines of all paginated messages share an ``ExpiryScheduler``. Deactivated messages have their reactions
+    deleted one at a time by a single worker, so that a burst of expiries does not spawn a burst of requests.
+    """
+
+    def __init__(self, client):
+        """
+        :param client: the Discord client the paginated messages are sent through
+        """
+        self.client = client
+        self.expiry = ExpiryScheduler()
+        self._cleanup_queue = None
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    def __len__(self):
+        """Returns the number of live paginated messages."""
+        return len(self.expiry)
+
+    def add(self, paginated, time_active):
+        """Start listening to reactions on a sent paginated message, deactivating it after ``time_active`` seconds
+        unless extended.
+        """
+        message_id = paginated.sent_message.id
+        self.client.register_reaction_listener(message_id, paginated._on_reaction_add_or_remove)
+        self.expiry.schedule(message_id, time_active, lambda: self._deactivate(paginated))
+
+    def extend(self, paginated, time_delay):
+        """Keep a paginated message live for at least ``time_delay`` more seconds."""
+        message_id = paginated.sent_message.id
+        if message_id in self.expiry:
+            self.expiry.schedule(message_id, time_delay, lambda: self._deactivate(paginated), extend_only=True)
+
+    def _deactivate(self, paginated):
+        """Remove the listener of a paginated message and queue the deletion of its reactions."""
+        message = paginated.sent_message
+        self.logger.info(f'Deactivating paginated message {message.id}')
+        self.client.unregister_reaction_listener(message.id)
+        if self._cleanup_queue is not None:
+            self._cleanup_queue.put_nowait((message.channel_id, message.id))
+
+    async def run(self):
+        """Run forever, deleting the reactions of deactivated paginated messages to signify deactivation."""
+        self._cleanup_queue = asyncio.Queue()
+        while True:
+            channel_id, message_id = await self._cleanup_queue.get()
+            try:
+                await self.client.delete_all_reactions(channel_id, message_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                self.logger.exception(f'Exception in deleting reactions on {message_id}: {ex}, continuing regardless')
 
 
 async def paginate_and_send(message, bot, channel_id, *, per_page, initial_page=1, time_active, time_delay):
     """Convenience method to paginate and send the given message."""
-    paginated = Paginated(message, per_page=per_page)
+    await send_pages(Pages(message, per_page=per_page), bot, channel_id, initial_page=initial_page,
+                     time_active=time_active, time_delay=time_delay)
+
+
+async def send_pages(pages, bot, channel_id, *, initial_page=1, time_active, time_delay):
+    """Convenience method to send the given pre-rendered ``Pages``."""
+    paginated = Paginated(pages)
     await paginated.send(bot, channel_id, page_num=initial_page, time_active=time_active, time_delay=time_delay)
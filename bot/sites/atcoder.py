@@ -1,9 +1,10 @@
 from datetime import datetime
 
 import aiohttp
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 
-from .competitive_programming_site import CPSite
+from . import parsing
+from .competitive_programming_site import CPSite, record_fetch
 from .models import Contest, Profile
 
 
@@ -14,58 +15,27 @@ class AtCoder(CPSite):
     CONTESTS_PATH = '/contests'
     USERS_PATH = '/users'
 
-    def __init__(self, *, contest_refresh_interval, user_refresh_interval, user_delay_interval):
-        super().__init__(contest_refresh_interval, user_refresh_interval, user_delay_interval)
-
     async def _request(self, path):
         path = self.BASE_URL + path
         headers = {'User-Agent': f'aiohttp/{aiohttp.__version__}'}
         self.logger.debug(f'GET {path} {headers}')
-        async with aiohttp.request('GET', path, headers=headers) as response:
+        async with self._get_session().get(path, headers=headers) as response:
             response.raise_for_status()
             return await response.text()
 
+    @record_fetch
     async def fetch_future_contests(self):
         """Overrides method in ContestSite"""
         html = await self._request(self.CONTESTS_PATH)
-        soup = BeautifulSoup(html, 'html.parser')
-
-        title = soup.find(text='Upcoming Contests')
-        if title is None:
+        contests = await self._parse(parse_future_contests, html)
+        if not contests:
             self.logger.info('No future contests')
-            return []
-
-        # Assuming table has > 0 entries if "Upcoming Contests" title is present
-        h4 = title.parent
-        newline = h4.next_sibling
-        div = newline.next_sibling
-        tbody = div.find('tbody')
-        rows = tbody.find_all('tr')
-        future_contests = []
-        for row in rows:
-            vals = row.find_all('td')
-
-            time_tag = vals[0].find('time')
-            # The string format is like so: 2018-09-08 21:00:00+0900
-            fmt = '%Y-%m-%d %H:%M:%S%z'
-            start = str(time_tag.string)
-            start = datetime.strptime(start, fmt)
-            start = int(start.timestamp())
-
-            name_tag = vals[1].find('a')
-            url = self.BASE_URL + name_tag['href']
-            name = str(name_tag.string)
-
-            # The duration format is like so: 01:40
-            duration_str = str(vals[2].string)
-            hrs, mins = duration_str.split(':')
-            length = int(hrs) * 60 * 60 + int(mins) * 60
-
-            future_contests.append(Contest(name, self.TAG, self.NAME, url, start, length))
-
+        future_contests = [Contest(name, self.TAG, self.NAME, self.BASE_URL + path, start, length)
+                           for name, path, start, length in contests]
         future_contests.sort()
         return future_contests
 
+    @record_fetch
     async def fetch_profile(self, handle):
         """Overrides method in CPSite"""
         path = self.USERS_PATH + '/' + handle
@@ -77,25 +47,78 @@ class AtCoder(CPSite):
                 return None
             raise
 
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # No option of real name on AtCoder.
-        name = None
-
-        avatar_tag = soup.find('img', class_='avatar')
-        avatar = avatar_tag['src']
+        avatar, rating = await self._parse(parse_profile, html)
         if 'avatar.png' in avatar:
             # Relative URL for default avatar
             avatar = self.BASE_URL + avatar
         else:
             # Absolute URL otherwise (img.atcoder.jp)
             pass
-
-        rating_heading = soup.find('th', text='Rating')
-        if rating_heading is None:
-            # User is unrated.
-            rating = None
-        else:
-            rating_tag = rating_heading.next_sibling.span
-            rating = int(rating_tag.string)
+        # No option of real name on AtCoder.
+        name = None
         return Profile(handle, self.TAG, self.NAME, self.BASE_URL + path, avatar, name, rating)
+
+
+_CONTESTS_STRAINER = parsing.headings_and('table')
+_PROFILE_STRAINER = SoupStrainer(['img', 'table'])
+
+
+def parse_future_contests(html):
+    """Parse the contests page.
+
+    :return: a list of tuples of name, path, start timestamp and length in seconds of each upcoming contest.
+    """
+    html = parsing.heading_section(html, 'Upcoming Contests')
+    if html is None:
+        return []
+    soup = parsing.make_soup(html, parse_only=_CONTESTS_STRAINER)
+
+    title = soup.find(text='Upcoming Contests')
+    if title is None:
+        return []
+
+    # Assuming table has > 0 entries if "Upcoming Contests" title is present
+    tbody = title.parent.find_next('tbody')
+    rows = tbody.find_all('tr')
+    contests = []
+    for row in rows:
+        vals = row.find_all('td')
+
+        time_tag = vals[0].find('time')
+        # The string format is like so: 2018-09-08 21:00:00+0900
+        fmt = '%Y-%m-%d %H:%M:%S%z'
+        start = str(time_tag.string)
+        start = datetime.strptime(start, fmt)
+        start = int(start.timestamp())
+
+        name_tag = vals[1].find('a')
+        path = name_tag['href']
+        name = str(name_tag.string)
+
+        # The duration format is like so: 01:40
+        duration_str = str(vals[2].string)
+        hrs, mins = duration_str.split(':')
+        length = int(hrs) * 60 * 60 + int(mins) * 60
+
+        contests.append((name, path, start, length))
+    return contests
+
+
+def parse_profile(html):
+    """Parse a user page.
+
+    :return: a tuple of the avatar URL, which is relative for the default avatar, and the rating, ``None`` if unrated.
+    """
+    soup = parsing.make_soup(html, parse_only=_PROFILE_STRAINER)
+
+    avatar_tag = soup.find('img', class_='avatar')
+    avatar = avatar_tag['src']
+
+    rating_heading = soup.find('th', text='Rating')
+    if rating_heading is None:
+        # User is unrated.
+        rating = None
+    else:
+        rating_tag = rating_heading.find_next_sibling('td').span
+        rating = int(rating_tag.string)
+    return avatar, rating
@@ -1,6 +1,8 @@
-import aiohttp
+import re
+import time
 
-from .competitive_programming_site import CPSite
+from .. import json_codec
+from .competitive_programming_site import FETCH_SECONDS, CPSite, record_fetch
 from .models import Contest, Profile
 
 
@@ -13,48 +15,97 @@ class Codeforces(CPSite):
     BASE_URL = 'http://codeforces.com'
     CONTESTS_PATH = '/contests'
     USERS_PATH = '/profile'
+    PROFILE_BATCH_SIZE = 200
+    # Comment on a failed user.info request, like so: handles: User with handle abc not found
+    _NOT_FOUND_RE = re.compile(r'handle (\S+) not found')
 
-    def __init__(self, *, contest_refresh_interval, user_refresh_interval, user_delay_interval):
-        super().__init__(contest_refresh_interval, user_refresh_interval, user_delay_interval)
+    def __init__(self, *, api_url=None, **kwargs):
+        """
+        :param api_url: the URL to use in place of ``API_URL``, such as that of a local replay server.
+        :param kwargs: the arguments for ``CPSite``.
+        """
+        super().__init__(**kwargs)
+        if api_url is not None:
+            self.API_URL = api_url
 
     async def _request(self, path, params=None, raise_for_status=True):
         path = self.API_URL + path
         self.logger.debug(f'GET {path} {params}')
-        async with aiohttp.request('GET', path, params=params) as response:
+        async with self._get_session().get(path, params=params) as response:
             if raise_for_status:
                 response.raise_for_status()
-            return await response.json()
+            return await response.json(loads=json_codec.loads)
 
+    @record_fetch
     async def fetch_future_contests(self):
         """Overrides method in ContestSite"""
         data = await self._request(self.API_CONTESTS_PATH)
-        assert data['status'] == 'OK', data['comment']
-        contests = [contest for contest in data['result'] if contest['phase'] == 'BEFORE']
-        future_contests = [Contest(contest['name'],
-                                   self.TAG,
-                                   self.NAME,
-                                   f'{self.BASE_URL}{self.CONTESTS_PATH}/{contest["id"]}',
-                                   contest.get('startTimeSeconds'),
-                                   contest['durationSeconds']) for contest in contests]
-        # TODO: Consider how to handle contests with missing start
-        future_contests = [contest for contest in future_contests if contest.start is not None]
+        contests = parse_future_contests(data)
+        future_contests = [Contest(name, self.TAG, self.NAME, f'{self.BASE_URL}{self.CONTESTS_PATH}/{contest_id}',
+                                   start, length) for name, contest_id, start, length in contests]
         future_contests.sort()
         return future_contests
 
     async def fetch_profile(self, handle):
         """Override method in CPSite"""
-        params = {'handles': handle}
-        data = await self._request(self.API_USERS_PATH, params=params, raise_for_status=False)
-        if data['status'] == 'FAILED' and 'not found' in data['comment']:
-            # User not found.
-            return None
-
-        result = data['result'][0]
-        fullname = ' '.join([result.get('firstName', ''), result.get('lastName', '')])
-        if fullname == ' ':
-            fullname = None
-        rating = result.get('rating')
-        url = self.BASE_URL + self.USERS_PATH + '/' + handle
-        # Avatar comes in the form '//userpic.codeforces.com/<userid>/avatar/<random_hex_string>.jpg'.
-        avatar = 'http:' + result['avatar']
-        return Profile(handle, self.TAG, self.NAME, url, avatar, fullname, rating)
+        profiles = await self.fetch_profiles([handle])
+        return profiles[handle]
+
+    @record_fetch
+    async def fetch_profiles(self, handles):
+        """Override method in CPSite"""
+        profiles = {}
+        handles = list(handles)
+        while handles:
+            params = {'handles': ';'.join(handles)}
+            start = time.perf_counter()
+            data = await self._request(self.API_USERS_PATH, params=params, raise_for_status=False)
+            if data['status'] == 'OK':
+                # Results are in the same order as the requested handles.
+                for handle, result in zip(handles, data['result']):
+                    fullname, avatar, rating = parse_profile(result)
+                    url = self.BASE_URL + self.USERS_PATH + '/' + handle
+                    profiles[handle] = Profile(handle, self.TAG, self.NAME, url, avatar, fullname, rating)
+                break
+
+            # The whole request fails if any one handle is not found, so drop that handle and try again.
+            match = self._NOT_FOUND_RE.search(data.get('comment', ''))
+            missing = match and next((handle for handle in handles if handle.lower() == match.group(1).lower()), None)
+            if missing is None:
+                raise ValueError(f'Request failed: {data.get("comment")}')
+            self.logger.info(f'Handle {missing} not found')
+            # Recorded like a fetch of the single profile by other sites, with the time of the failed request.
+            FETCH_SECONDS.labels(self.TAG, 'fetch_profile', 'not_found').observe(time.perf_counter() - start)
+            profiles[missing] = None
+            handles.remove(missing)
+            if handles:
+                await self._fetch_throttle.acquire()
+        return profiles
+
+
+def parse_future_contests(data):
+    """Parse a contest.list response.
+
+    :return: a list of tuples of name, ID, start timestamp and length in seconds of each contest yet to start.
+    """
+    assert data['status'] == 'OK', data['comment']
+    contests = []
+    for contest in data['result']:
+        # TODO: Consider how to handle contests with missing start
+        if contest['phase'] == 'BEFORE' and contest.get('startTimeSeconds') is not None:
+            contests.append((contest['name'], contest['id'], contest['startTimeSeconds'], contest['durationSeconds']))
+    return contests
+
+
+def parse_profile(result):
+    """Parse a user object of a user.info response.
+
+    :return: a tuple of the full name, ``None`` if unavailable, the avatar URL and the rating, ``None`` if unrated.
+    """
+    fullname = ' '.join([result.get('firstName', ''), result.get('lastName', '')])
+    if fullname == ' ':
+        fullname = None
+    rating = result.get('rating')
+    # Avatar comes in the form '//userpic.codeforces.com/<userid>/avatar/<random_hex_string>.jpg'.
+    avatar = 'http:' + result['avatar']
+    return fullname, avatar, rating
@@ -1,12 +1,42 @@
 import asyncio
+import functools
 import logging
 import time
 from datetime import datetime, timezone
 
+import aiohttp
+
+from ..metrics import REGISTRY, Timer
+from .contest_index import ContestIndex
+from .refresh_scheduler import RefreshScheduler
+from .throttle import TokenBucket
+
+FETCH_SECONDS = REGISTRY.histogram('site_fetch_duration_seconds', 'Duration of fetches from sites',
+                                   ['site', 'operation', 'outcome'])
+
+
+def record_fetch(func):
+    """Decorates a fetch method of a site to record its duration and outcome, which is ``success``, ``not_found`` if
+    it returned ``None``, or ``error``.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        with Timer(FETCH_SECONDS, self.TAG, func.__name__) as timer:
+            result = await func(self, *args, **kwargs)
+            if result is None:
+                timer.outcome = 'not_found'
+            return result
+    return wrapper
+
 
 class ContestSite:
     """A site that has contests."""
 
+    # The time in seconds after which a fetch of contests is abandoned.
+    CONTEST_FETCH_TIMEOUT = 60
+    # The interval between attempts to fetch contests until they are fetched for the first time.
+    CONTEST_RETRY_INTERVAL = 60
+
     def __init__(self, contest_refresh_interval):
         """
         :param contest_refresh_interval: the interval between consecutive requests to the site to fetch contests.
@@ -14,73 +44,81 @@ class ContestSite:
         self.contest_refresh_interval = contest_refresh_interval
         self.future_contests = None
         self.contests_last_fetched = None
+        self.contest_index = ContestIndex([])
+        # Called without arguments whenever contests are updated.
+        self.on_contests_update = None
         self.logger = logging.getLogger(self.__class__.__qualname__)
 
     async def run(self):
-        """Update the contest list and schedule future updates."""
+        """Schedule updates of the contest list, the first one right away.
+
+        Contests are fetched in the background, so that a slow or failing site does not hold up others. Until they are
+        first fetched, ``future_contests`` is ``None`` unless restored from a snapshot.
+        """
         self.logger.info('Setting up site...')
-        # Initial fetch.
-        await self.update_contests()
-        # Schedule for future.
         asyncio.create_task(self._contest_updater_task())
 
+    @property
+    def contests_loaded(self):
+        """Whether contests have been fetched or restored."""
+        return self.future_contests is not None
+
+    def restore_contests(self, contests, last_fetched):
+        """Restore contests saved in a snapshot, which are served until contests are fetched again.
+
+        :param contests: the list of contests
+        :param last_fetched: the time the contests were fetched at
+        """
+        self.set_future_contests(contests)
+        self.contests_last_fetched = last_fetched
+
     async def update_contests(self):
         """Update the list of future contests."""
-        self.future_contests = await self.fetch_future_contests()
+        self.set_future_contests(await asyncio.wait_for(self.fetch_future_contests(), self.CONTEST_FETCH_TIMEOUT))
         self.logger.info(f'Updated! {len(self.future_contests)} upcoming')
         self.logger.debug(f'Fetched contests: {self.future_contests}')
         self.contests_last_fetched = time.time()
+        if self.on_contests_update is not None:
+            self.on_contests_update()
 
     async def _contest_updater_task(self):
-        """Run forever and update contests at regular intervals."""
+        """Run forever and update contests at regular intervals, retrying sooner until they are first fetched."""
+        delay = 0
         while True:
             try:
-                await asyncio.sleep(self.contest_refresh_interval)
+                await asyncio.sleep(delay)
                 await self.update_contests()
             except asyncio.CancelledError:
                 self.logger.info('Received CancelledError, stopping task')
                 break
+            except asyncio.TimeoutError:
+                self.logger.warning(f'Fetching contests timed out after {self.CONTEST_FETCH_TIMEOUT}s, continuing '
+                                    f'regardless')
             except Exception as ex:
                 self.logger.exception(f'Exception in fetching: {ex}, continuing regardless')
+            delay = self.contest_refresh_interval if self.contests_loaded else self.CONTEST_RETRY_INTERVAL
 
     async def fetch_future_contests(self):
         raise NotImplementedError('This method must be overridden')
 
-    @staticmethod
-    def filter_by_site(site_tags):
-        if not site_tags:
-            return lambda contest: True
-        return lambda contest: contest.site_tag in site_tags
-
-    @staticmethod
-    def filter_by_start_min(start_min):
-        return lambda contest: start_min < contest.start
-
-    @staticmethod
-    def filter_by_start_max(start_max):
-        return lambda contest: contest.start <= start_max
-
-    def _get_future_contests(self):
-        """ Returns future contests. Because the contests are fetched every self.refresh_interval time,
-        self.future_contests may contain contests which have already started. This function filters out such contests.
-        """
-        now = datetime.now(timezone.utc).timestamp()
-        future_contests = filter(self.filter_by_start_min(now), self.future_contests)
-        return future_contests
+    def set_future_contests(self, contests):
+        """Set the list of future contests and index them for queries."""
+        self.contest_index = ContestIndex(contests)
+        self.future_contests = self.contest_index.contests
 
     def get_future_contests_cnt(self, cnt, sites_tags):
         """Get the given number of future contests.
 
+        Because contests are fetched every ``contest_refresh_interval``, the list of contests may contain contests which
+        have already started, these are left out.
+
         :param cnt: the number of contests to get, and integer or ``"all"``.
         :param sites_tags: the site tags for sites to filter by.
         :return: a list of contests.
         """
         self.logger.info(f'get_future_contests_cnt: {cnt} {sites_tags}')
-        future_contests = self._get_future_contests()
-        filtered_by_site = filter(self.filter_by_site(sites_tags), future_contests)
-        if cnt == 'all':
-            cnt = len(self.future_contests)
-        return list(filtered_by_site)[:cnt]
+        now = datetime.now(timezone.utc).timestamp()
+        return self.contest_index.get_first(None if cnt == 'all' else cnt, now, sites_tags)
 
     def get_future_contests_before(self, start_max, site_tags):
         """Get future contests starting before the given time.
@@ -89,62 +127,212 @@ class ContestSite:
         :param site_tags: the site tags for sites to filter by.
         :return: a list of contests.
         """
-        future_contests = self._get_future_contests()
-        filtered_by_site = filter(self.filter_by_site(site_tags), future_contests)
-        filtered_by_start = filter(self.filter_by_start_max(start_max), filtered_by_site)
-        return list(filtered_by_start)
+        now = datetime.now(timezone.utc).timestamp()
+        return self.contest_index.get_between(now, start_max, site_tags)
 
 
 class CPSite(ContestSite):
     """A site that has contests as well as users."""
 
-    def __init__(self, contest_refresh_interval, user_refresh_interval, user_delay_interval):
+    # The number of handles fetched per request by fetch_profiles, None if the site does not support batched fetches.
+    PROFILE_BATCH_SIZE = None
+    # The maximum number of fetched profiles waiting to be handled before fetching pauses.
+    FETCHED_QUEUE_SIZE = 100
+    DNS_CACHE_TTL = 300
+    KEEPALIVE_TIMEOUT = 60
+
+    def __init__(self, *, contest_refresh_interval, user_refresh_interval, user_delay_interval, max_connections=4,
+                 fetch_concurrency=2, handler_concurrency=4,
+                 rating_refresh_delay=600, rating_refresh_max_interval=3600, rating_refresh_window=24 * 60 * 60,
+                 base_url=None):
         """
         :param contest_refresh_interval: the interval between consecutive requests to the site to fetch contests.
-        :param user_refresh_interval: the interval between consecutive requests to the site to fetch users.
-        :param user_delay_interval: the delay between requests for two consecutive users.
+        :param user_refresh_interval: the interval between consecutive requests to the site to fetch users, when no
+                                      contest has recently ended.
+        :param user_delay_interval: the average delay between consecutive requests to the site to fetch profiles, 0 for
+                                    no delay.
+        :param max_connections: the maximum number of simultaneous connections to a host of the site.
+        :param fetch_concurrency: the maximum number of profile requests in flight at once.
+        :param handler_concurrency: the maximum number of fetched profiles being handled at once.
+        :param rating_refresh_delay: the delay between the end of a contest and the first refresh of users.
+        :param rating_refresh_max_interval: the maximum interval between refreshes of users while waiting for ratings
+                                            to be updated after a contest.
+        :param rating_refresh_window: the time after the end of a contest for which ratings are awaited.
+        :param base_url: the URL to use in place of ``BASE_URL``, such as that of a local replay server.
         """
         super().__init__(contest_refresh_interval)
+        if base_url is not None:
+            self.BASE_URL = base_url
         self.user_refresh_interval = user_refresh_interval
         self.user_delay_interval = user_delay_interval
-        self.get_all_users = None
+        self.max_connections = max_connections
+        self.fetch_concurrency = fetch_concurrency
+        self.handler_concurrency = handler_concurrency
+        if user_delay_interval < 0:
+            raise ValueError(f'user_delay_interval must not be negative, found {user_delay_interval}')
+        self._fetch_throttle = TokenBucket(1 / user_delay_interval if user_delay_interval > 0 else None)
+        self.refresh_scheduler = RefreshScheduler(user_refresh_interval, rating_refresh_delay,
+                                                  rating_refresh_max_interval, rating_refresh_window)
+        self.get_handles = None
+        self.get_subscribers = None
         self.on_profile_fetch = None
+        self.parse_executor = None
+        self._session = None
 
-    async def run(self, get_all_users=None, on_profile_fetch=None):
+    def _get_session(self):
+        """Returns the HTTP session of the site, creating it if necessary.
+
+        Connections are kept alive and DNS lookups are cached across requests.
+        """
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit_per_host=self.max_connections,
+                                             ttl_dns_cache=self.DNS_CACHE_TTL,
+                                             keepalive_timeout=self.KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _parse(self, func, *args):
+        """Run a parsing function in ``parse_executor``, so that parsing does not block the event loop.
+
+        The default executor of the event loop is used if ``parse_executor`` is ``None``. If it is a process pool,
+        ``func`` must be a module level function.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.parse_executor, functools.partial(func, *args))
+
+    async def close(self):
+        """Close the HTTP session of the site."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def run(self, get_handles=None, get_subscribers=None, on_profile_fetch=None):
         """
         Schedule regular fetch of contests and profiles.
 
-        :param get_all_users: the function that provides a list of users to fetch.
+        :param get_handles: the function that provides a list of handles to fetch for a site tag. Profiles are not
+                            fetched if ``None``.
+        :param get_subscribers: the function that provides a list of users subscribed to a handle for a site tag.
         :param on_profile_fetch: the callback to be executed when a profile is fetched.
         :return:
         """
-        self.get_all_users = get_all_users
+        self.get_handles = get_handles
+        self.get_subscribers = get_subscribers
         self.on_profile_fetch = on_profile_fetch
         await super().run()
-        asyncio.create_task(self._user_updater_task())
+        if get_handles is not None:
+            asyncio.create_task(self._user_updater_task())
+
+    async def update_contests(self):
+        """Overrides method in ContestSite"""
+        await super().update_contests()
+        self.refresh_scheduler.track_contests(self.future_contests)
+
+    def restore_contests(self, contests, last_fetched):
+        """Overrides method in ContestSite"""
+        super().restore_contests(contests, last_fetched)
+        self.refresh_scheduler.track_contests(self.future_contests)
 
     async def update_users(self):
-        """Update all users provided by the registered function ``get_all_users``."""
-        if self.get_all_users is None or self.on_profile_fetch is None:
+        """Update all users subscribed to handles provided by the registered function ``get_handles``.
+
+        Profiles are fetched by ``fetch_concurrency`` workers at the rate allowed by ``user_delay_interval``, and handed
+        over to ``handler_concurrency`` workers that run the registered callback, so that slow callbacks do not hold up
+        fetching. Each handle is fetched once and the profile passed on for every subscriber, with
+        ``PROFILE_BATCH_SIZE`` handles per request if the site supports it.
+
+        :return: whether the rating of any user changed.
+        """
+        if self.get_handles is None or self.get_subscribers is None or self.on_profile_fetch is None:
             self.logger.info('Profile handlers not registered')
-            return
-
-        for user in self.get_all_users():
-            old_profile = user.get_profile_for_site(self.TAG)
-            if old_profile is None:
-                # The user has not registered a profile for this site.
-                continue
-            new_profile = await self.fetch_profile(old_profile.handle)
-            self.logger.info(f'Profile with handle {old_profile.handle} fetched')
-            await self.on_profile_fetch(user, old_profile, new_profile)
-            await asyncio.sleep(self.user_delay_interval)
+            return False
+
+        handles = self.get_handles(self.TAG)
+        batch_size = self.PROFILE_BATCH_SIZE or 1
+        batches = asyncio.Queue()
+        for begin in range(0, len(handles), batch_size):
+            batches.put_nowait(handles[begin:begin + batch_size])
+        fetched = asyncio.Queue(maxsize=self.FETCHED_QUEUE_SIZE)
+        ratings_changed = False
+
+        async def fetch_worker():
+            while not batches.empty():
+                batch = batches.get_nowait()
+                await self._fetch_throttle.acquire()
+                try:
+                    if self.PROFILE_BATCH_SIZE is None:
+                        profiles = {batch[0]: await self.fetch_profile(batch[0])}
+                    else:
+                        profiles = await self.fetch_profiles(batch)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    self.logger.exception(f'Exception in fetching profiles {batch}: {ex}, continuing regardless')
+                    continue
+                self.logger.info(f'{len(profiles)} profiles fetched')
+                for item in profiles.items():
+                    await fetched.put(item)
+
+        async def handler_worker():
+            nonlocal ratings_changed
+            while True:
+                handle, new_profile = await fetched.get()
+                try:
+                    for user in self.get_subscribers(self.TAG, handle):
+                        old_profile = user.get_profile_for_site(self.TAG)
+                        if old_profile is None or old_profile.handle != handle:
+                            # The user changed or removed the profile while earlier subscribers were handled.
+                            continue
+                        # A failure for one subscriber, such as a DM that cannot be sent, does not affect the others.
+                        try:
+                            ratings_changed |= await self._on_profile_fetch(user, old_profile, new_profile)
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception as ex:
+                            self.logger.exception(f'Exception in handling profile {handle} of user {user.discord_id}: '
+                                                  f'{ex}, continuing regardless')
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    self.logger.exception(f'Exception in handling profile {handle}: {ex}, continuing regardless')
+                finally:
+                    fetched.task_done()
+
+        fetchers = [asyncio.create_task(fetch_worker()) for _ in range(self.fetch_concurrency)]
+        handlers = [asyncio.create_task(handler_worker()) for _ in range(self.handler_concurrency)]
+        try:
+            await asyncio.gather(*fetchers)
+            await fetched.join()
+        finally:
+            for task in fetchers + handlers:
+                task.cancel()
+        return ratings_changed
+
+    async def _on_profile_fetch(self, user, old_profile, new_profile):
+        """Passes on a fetched profile to the registered callback. Returns whether the rating changed."""
+        if new_profile is None:
+            self.logger.info(f'Profile with handle {old_profile.handle} not found, skipping')
+            return False
+        await self.on_profile_fetch(user, old_profile, new_profile)
+        return old_profile.rating != new_profile.rating
 
     async def _user_updater_task(self):
-        """Run forever and update users at regular intervals."""
+        """Run forever and update users when the refresh scheduler deems necessary."""
+        last_refresh = time.time()
         while True:
             try:
-                await asyncio.sleep(self.user_refresh_interval)
-                await self.update_users()
+                delay = self.refresh_scheduler.next_refresh_time(last_refresh) - time.time()
+                if delay > 0:
+                    # Newly fetched contests may call for an earlier refresh, so check again after contests are
+                    # refreshed.
+                    await asyncio.sleep(min(delay, self.contest_refresh_interval))
+                    continue
+                last_refresh = time.time()
+                ratings_changed = False
+                try:
+                    ratings_changed = await self.update_users()
+                finally:
+                    self.refresh_scheduler.on_refresh(last_refresh, ratings_changed)
             except asyncio.CancelledError:
                 self.logger.info('Received CancelledError, stopping task')
                 break
@@ -153,3 +341,10 @@ class CPSite(ContestSite):
 
     async def fetch_profile(self, handle):
         raise NotImplementedError('This method must be overridden')
+
+    async def fetch_profiles(self, handles):
+        """Fetch the profiles for the given handles in batch.
+
+        :return: a dict mapping each handle to its profile, or to ``None`` if no such user exists.
+        """
+        raise NotImplementedError('This method must be overridden if PROFILE_BATCH_SIZE is set')
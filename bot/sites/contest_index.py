@@ -0,0 +1,57 @@
+import bisect
+import heapq
+import itertools
+
+
+class ContestIndex:
+    """Contests sorted by start time, overall and per site, so that contests in a time range are found by bisection."""
+
+    def __init__(self, contests):
+        """
+        :param contests: the contests to index
+        """
+        self.contests = sorted(contests)
+        self.starts = [contest.start for contest in self.contests]
+        self._site_partitions = {}
+        for contest in self.contests:
+            site_contests, site_starts = self._site_partitions.setdefault(contest.site_tag, ([], []))
+            site_contests.append(contest)
+            site_starts.append(contest.start)
+
+    def _partitions(self, site_tags):
+        if not site_tags:
+            return [(self.contests, self.starts)]
+        return [self._site_partitions[site_tag] for site_tag in site_tags if site_tag in self._site_partitions]
+
+    def get_first(self, cnt, start_min, site_tags=None):
+        """Returns the first contests that start after a time.
+
+        :param cnt: the maximum number of contests to return, all if ``None``.
+        :param start_min: the time as UTC timestamp, contests must start strictly later.
+        :param site_tags: the site tags for sites to filter by, all sites if empty.
+        """
+        slices = []
+        for contests, starts in self._partitions(site_tags):
+            begin = bisect.bisect_right(starts, start_min)
+            slices.append(contests[begin:] if cnt is None else contests[begin:begin + cnt])
+        return self._merge(slices, cnt)
+
+    def get_between(self, start_min, start_max, site_tags=None):
+        """Returns the contests that start after a time and no later than another.
+
+        :param start_min: the time as UTC timestamp, contests must start strictly later.
+        :param start_max: the time as UTC timestamp, contests must start no later.
+        :param site_tags: the site tags for sites to filter by, all sites if empty.
+        """
+        slices = []
+        for contests, starts in self._partitions(site_tags):
+            begin = bisect.bisect_right(starts, start_min)
+            end = bisect.bisect_right(starts, start_max)
+            slices.append(contests[begin:end])
+        return self._merge(slices)
+
+    @staticmethod
+    def _merge(slices, cnt=None):
+        if len(slices) == 1:
+            return slices[0]
+        return list(itertools.islice(heapq.merge(*slices), cnt))
@@ -22,6 +22,14 @@ class Contest:
     def __lt__(self, other):
         return (self.start, self.length, self.site_name) < (other.start, other.length, other.site_name)
 
+    @classmethod
+    def from_dict(cls, contest_dict):
+        params = [contest_dict.get(key) for key in cls.__slots__]
+        return Contest(*params)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
     def __repr__(self):
         return '<Contest' + str((self.name, self.site_tag, self.site_name, self.url, self.start, self.length)) + '>'
 
@@ -0,0 +1,56 @@
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+HEADINGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+
+
+def make_soup(html, parse_only=None):
+    """Parse the given HTML with the fastest parser available.
+
+    :param html: the HTML to parse
+    :param parse_only: a ``SoupStrainer``, if given only matching tags and their descendants are built
+    :return: the ``BeautifulSoup`` object
+    """
+    return BeautifulSoup(html, PARSER, parse_only=parse_only)
+
+
+def has_class(*class_names):
+    """Returns a function matching a class attribute containing any of the given classes, for use with
+    ``SoupStrainer``.
+
+    Attributes are matched as they are parsed, when a multi-valued class attribute is still a single string.
+    """
+    class_names = set(class_names)
+
+    def match(value):
+        if not value:
+            return False
+        classes = value.split() if isinstance(value, str) else value
+        return not class_names.isdisjoint(classes)
+    return match
+
+
+def headings_and(*names):
+    """Returns a ``SoupStrainer`` that keeps headings and tags with the given names."""
+    return SoupStrainer(HEADINGS + list(names))
+
+
+def heading_section(html, heading):
+    """Returns the part of the HTML from the heading with the given text to the end of the first table after it, or
+    ``None`` if there is no such heading.
+
+    Parsing only this part avoids building the rest of a large page, such as an archive of past contests, which
+    strainers do not help with when it is made of the same tags.
+    """
+    match = re.search(f'<h[1-6][^>]*>{re.escape(heading)}</h[1-6]>', html)
+    if match is None:
+        return None
+    end = html.find('</table>', match.end())
+    return html[match.start():] if end == -1 else html[match.start():end + len('</table>')]
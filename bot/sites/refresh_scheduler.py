@@ -0,0 +1,85 @@
+import logging
+import time
+
+
+class _Watch:
+    __slots__ = ('end', 'next_refresh', 'interval')
+
+    def __init__(self, end, next_refresh, interval):
+        self.end = end
+        self.next_refresh = next_refresh
+        self.interval = interval
+
+
+class RefreshScheduler:
+    """Decides when the profiles of a site should be refreshed.
+
+    Ratings only change after a contest ends, so every contest seen is watched. Profiles are refreshed densely after a
+    watched contest ends, backing off exponentially until a rating change is seen or the watch window runs out, and
+    sparsely otherwise.
+    """
+
+    def __init__(self, sparse_interval, initial_delay, max_interval, window):
+        """
+        :param sparse_interval: the interval between refreshes when no contest is being watched.
+        :param initial_delay: the delay between the end of a contest and the first refresh.
+        :param max_interval: the maximum interval between refreshes while a contest is being watched.
+        :param window: the time after the end of a contest after which it is no longer watched.
+        """
+        self.sparse_interval = sparse_interval
+        self.initial_delay = initial_delay
+        self.max_interval = max_interval
+        self.window = window
+        self._watches = {}
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    def track_contests(self, contests):
+        """Watch the given contests. Contests are identified by their URL."""
+        now = time.time()
+        for contest in contests:
+            end = contest.start + contest.length
+            watch = self._watches.get(contest.url)
+            if watch is None:
+                if now >= end + self.window:
+                    continue
+                self._watches[contest.url] = _Watch(end, end + self.initial_delay, self.initial_delay)
+                self.logger.debug(f'Watching contest {contest.name} ending at {end}')
+            elif watch.end != end:
+                # The contest was rescheduled.
+                watch.end = end
+                watch.next_refresh = end + self.initial_delay
+
+    def next_refresh_time(self, last_refresh):
+        """Returns the timestamp at which the next refresh should happen."""
+        next_refresh = last_refresh + self.sparse_interval
+        for watch in self._watches.values():
+            next_refresh = min(next_refresh, watch.next_refresh)
+        return next_refresh
+
+    def on_refresh(self, now, ratings_changed):
+        """Update the watches after a refresh.
+
+        Only watches for which the refresh was due are affected, a refresh before ``initial_delay`` after the end of a
+        contest says nothing about its ratings. Profiles do not tell which contest changed a rating, so a rating change
+        is attributed to the due contest that ended first, as ratings are usually updated in the order contests end.
+        Other due contests keep being watched with backoff.
+
+        :param now: the timestamp at which the refresh started.
+        :param ratings_changed: whether the refresh found any changed ratings.
+        """
+        due = []
+        for url, watch in list(self._watches.items()):
+            if now >= watch.end + self.window:
+                self.logger.debug(f'No longer watching contest {url}, window passed')
+                del self._watches[url]
+            elif watch.end <= now and watch.next_refresh <= now:
+                due.append((watch.end, url))
+        if ratings_changed and due:
+            _, url = min(due)
+            self.logger.debug(f'No longer watching contest {url}, ratings changed')
+            del self._watches[url]
+        for _, url in due:
+            watch = self._watches.get(url)
+            if watch is not None:
+                watch.interval = min(watch.interval * 2, self.max_interval)
+                watch.next_refresh = now + watch.interval
@@ -1,41 +1,85 @@
 import logging
+import time
 
 from .competitive_programming_site import ContestSite
+from .models import Contest
 
 
 class SiteContainer(ContestSite):
-    """Manages multiple sites."""
+    """Manages multiple sites.
 
-    def __init__(self, sites, contest_refresh_interval=None):
+    The contests of the container are those of all sites that have loaded contests, combined whenever a site updates
+    its contests.
+    """
+
+    def __init__(self, sites, parse_executor=None):
         """
         :param sites: the list of ``CPSite`` objects to manage.
-        :param contest_refresh_interval: the interval between updating the list of contests.
+        :param parse_executor: the executor the sites parse pages in, the default executor of the event loop if
+                               ``None``.
         """
-        if contest_refresh_interval is None:
-            contest_refresh_interval = min(site.contest_refresh_interval for site in sites)
-        super().__init__(contest_refresh_interval)
+        super().__init__(min(site.contest_refresh_interval for site in sites))
         self.sites = sites
+        for site in self.sites:
+            site.parse_executor = parse_executor
+            site.on_contests_update = self._combine_contests
         self._site_map = {site.TAG: site for site in self.sites}
+        self.set_future_contests([])
         self.logger = logging.getLogger(self.__class__.__qualname__)
 
-    async def run(self, get_all_users=None, on_profile_fetch=None):
-        """Set up each site being managed.
+    async def run(self, get_handles=None, get_subscribers=None, on_profile_fetch=None):
+        """Set up each site being managed. Sites fetch contests concurrently in the background.
 
-        :param get_all_users: the function that provides a list of users to fetch.
+        :param get_handles: the function that provides a list of handles to fetch for a site tag.
+        :param get_subscribers: the function that provides a list of users subscribed to a handle for a site tag.
         :param on_profile_fetch: the callback to be executed when a profile is fetched.
         """
         self.logger.info('Setting up the SiteContainer...')
         for site in self.sites:
-            await site.run(get_all_users=get_all_users, on_profile_fetch=on_profile_fetch)
-        await super().run()
+            await site.run(get_handles=get_handles, get_subscribers=get_subscribers,
+                           on_profile_fetch=on_profile_fetch)
+
+    async def close(self):
+        """Close each site being managed."""
+        for site in self.sites:
+            await site.close()
+
+    def restore(self, state):
+        """Restores the contests of each site from the state of a snapshot, see ``get_state``."""
+        for site_tag, site_state in state['contests'].items():
+            site = self._site_map.get(site_tag)
+            if site is not None:
+                contests = [Contest.from_dict(contest_d) for contest_d in site_state['contests']]
+                site.restore_contests(contests, site_state['last_fetched'])
+                self.logger.info(f'Restored {len(contests)} contests of {site.NAME} from snapshot')
+        self._combine_contests()
 
-    async def fetch_future_contests(self):
-        """Overrides method in ContestSite"""
+    def get_state(self):
+        """Returns the contests of each site as a ``dict`` of plain data to be saved in a snapshot."""
+        return {
+            'contests': {
+                site.TAG: {
+                    'contests': [contest.to_dict() for contest in site.future_contests],
+                    'last_fetched': site.contests_last_fetched,
+                } for site in self.sites if site.contests_loaded
+            },
+        }
+
+    def _combine_contests(self):
         future_contests = []
         for site in self.sites:
-            future_contests += site.future_contests
-        future_contests.sort()
-        return future_contests
+            if site.contests_loaded:
+                future_contests += site.future_contests
+        self.set_future_contests(future_contests)
+        self.contests_last_fetched = time.time()
+
+    def get_loading_site_names(self, site_tags=None):
+        """Returns the names of the sites that have not loaded contests yet.
+
+        :param site_tags: the site tags for sites to filter by.
+        """
+        return [site.NAME for site in self.sites
+                if not site.contests_loaded and (not site_tags or site.TAG in site_tags)]
 
     async def fetch_profile(self, handle, site_tag):
         """Fetch the profile for the given handle and site."""
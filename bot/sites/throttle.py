@@ -0,0 +1,40 @@
+import asyncio
+
+
+class TokenBucket:
+    """Limits the rate of an operation with a token bucket.
+
+    Tokens are added at a constant rate up to the capacity of the bucket, and every operation takes one token, waiting
+    for it if necessary. Waiters are served in order.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        :param rate: the number of tokens added per second, must be positive, or ``None`` for no limit.
+        :param capacity: the maximum number of tokens held, which is the largest burst allowed.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = None
+        self._lock = None
+
+    async def acquire(self):
+        """Wait for and take a token."""
+        if self.rate is None:
+            return
+        if self._lock is None:
+            # Created lazily so that it is bound to the running event loop.
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self._last is not None:
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                self._tokens = 1
+                self._last = loop.time()
+            self._tokens -= 1
@@ -0,0 +1,58 @@
+import gzip
+import logging
+import os
+import time
+
+from . import json_codec
+
+
+class Snapshot:
+    """A local file holding the state of the bot, from which it can start answering commands before the database is
+    loaded and the sites are fetched.
+
+    The state is a ``dict`` of plain data, saved as gzipped JSON after a header with the format version. Files with
+    another version, or that cannot be read, are ignored.
+    """
+
+    MAGIC = b'CPBOT-SNAPSHOT'
+    VERSION = 2
+
+    def __init__(self, path):
+        """
+        :param path: the path of the snapshot file
+        """
+        self.path = path
+        self.logger = logging.getLogger(self.__class__.__qualname__)
+
+    def load(self):
+        """Returns the saved state, or ``None`` if there is no usable snapshot."""
+        header = self.MAGIC + bytes([self.VERSION])
+        try:
+            with open(self.path, 'rb') as file:
+                if file.read(len(header)) != header:
+                    self.logger.warning(f'Ignoring snapshot {self.path} with unknown format')
+                    return None
+                state = json_codec.loads(gzip.decompress(file.read()))
+        except FileNotFoundError:
+            self.logger.info(f'No snapshot at {self.path}')
+            return None
+        except Exception as ex:
+            self.logger.warning(f'Ignoring unreadable snapshot {self.path}: {ex}')
+            return None
+        age = (time.time() - state['time']) / 60
+        self.logger.info(f'Loaded snapshot {self.path} saved {age:.0f} mins ago')
+        return state
+
+    def save(self, state):
+        """Saves the given state, replacing the previous snapshot only once it is completely written.
+
+        This blocks on encoding and writing, so the state must not be modified meanwhile if it is saved outside the
+        event loop thread.
+        """
+        state = dict(state, time=time.time())
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(self.MAGIC + bytes([self.VERSION]))
+            file.write(gzip.compress(json_codec.dumps(state).encode()))
+        os.replace(temp_path, self.path)
+        self.logger.info(f'Saved snapshot {self.path}')